@@ -0,0 +1,98 @@
+import argparse
+import asyncio
+import json
+import logging
+import subprocess
+import sys
+import time
+from profiling import LoopLagMonitor
+from .probes import get_peak_rss_mb
+from .scenarios import SCENARIOS, run_repost, run_upload
+from .vk_server import VkStandIn
+
+RUNNERS = {"upload": run_upload, "repost": run_repost}
+
+
+async def run_scenario(name: str) -> dict:
+    params = SCENARIOS[name]
+    vk = VkStandIn(
+        params.get("vk_latency", 0),
+        params.get("upload_latency", 0),
+        params.get("error_rates"),
+    ).start()
+    monitor = LoopLagMonitor()
+    monitor.start()
+    started = time.monotonic()
+    try:
+        extra = await RUNNERS[params["kind"]](vk, params)
+    finally:
+        seconds = time.monotonic() - started
+        await monitor.stop()
+        vk.stop()
+
+    photos = vk.saved
+    vk_calls = sum(vk.calls.values())
+    report = {
+        "scenario": name,
+        "photos": photos,
+        "seconds": round(seconds, 2),
+        "photos_per_sec": round(photos / seconds, 2),
+        "vk_calls": vk_calls,
+        "vk_calls_per_photo": round(vk_calls / photos, 2) if photos else None,
+        "vk_errors": dict(vk.errors),
+        "uploaded_mb": round(vk.uploaded_bytes / 1024 / 1024, 1),
+        "peak_rss_mb": get_peak_rss_mb(),
+        **monitor.get_stats(),
+    }
+    if "tg_calls" in extra:
+        tg_calls = extra.pop("tg_calls")
+        report["tg_calls_per_photo"] = round(tg_calls / photos, 2) if photos else None
+    report.update(extra)
+    return report
+
+
+def run_isolated(name: str, verbose: bool) -> dict:
+    command = [sys.executable, "-m", "benchmarks", "--json", "--in-process", name]
+    if verbose:
+        command.append("-v")
+    output = subprocess.run(command, check=True, capture_output=True, text=True)
+    return json.loads(output.stdout)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument("scenarios", nargs="*", help=", ".join(SCENARIOS))
+    parser.add_argument("--json", action="store_true", help="print JSON report")
+    parser.add_argument(
+        "--in-process",
+        action="store_true",
+        help="run all scenarios in this process (peak RSS becomes cumulative)",
+    )
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    names = args.scenarios or list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    if args.in_process:
+        reports = [asyncio.run(run_scenario(name)) for name in names]
+    else:
+        reports = [run_isolated(name, args.verbose) for name in names]
+
+    if args.json:
+        print(json.dumps(reports, indent=4))
+        return
+    for report in reports:
+        print(
+            f"{report['scenario']:<15} {report['photos']:>5} photos "
+            f"{report['photos_per_sec']:>8} photos/s "
+            f"{report['vk_calls_per_photo']} VK calls/photo "
+            f"{report['peak_rss_mb']} MB RSS "
+            f"{report['loop_lag_max_ms']} ms max loop lag"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import asyncio
+import os
+import random
+from collections import Counter
+from datetime import datetime, timedelta
+from io import BytesIO
+from types import SimpleNamespace
+from PIL import Image
+from pyrogram.enums import ChatType, MessageMediaType
+from pyrogram.errors import FloodWait
+from pyrogram.types import Chat, Message, Photo
+
+
+def make_jpegs(amount: int, size: tuple[int, int], seed: int = 0) -> list[bytes]:
+    rand = random.Random(seed)
+    jpegs = []
+    for _ in range(amount):
+        noise = bytes(rand.getrandbits(8) for _ in range(size[0] * size[1] * 3 // 64))
+        image = Image.frombytes("RGB", (size[0] // 8, size[1] // 8), noise)
+        buffer = BytesIO()
+        image.resize(size).save(buffer, "JPEG", quality=90)
+        jpegs.append(buffer.getvalue())
+    return jpegs
+
+
+def make_history(
+    chat: Chat,
+    photos: int,
+    group_share: float = 0.3,
+    text_share: float = 0.2,
+    photo_size: int = 200_000,
+    seed: int = 0,
+) -> list[Message]:
+    rand = random.Random(seed)
+    date = datetime(2024, 1, 1)
+    messages = []
+
+    def add(**kwargs):
+        nonlocal date
+        date += timedelta(seconds=rand.randint(1, 90))
+        messages.append(
+            Message(id=len(messages) + 1, chat=chat, date=date, **kwargs)
+        )
+
+    def add_photo(caption: str | None = None, group_id: str | None = None):
+        photo = Photo(
+            file_id=f"{chat.id}_{len(messages) + 1}",
+            file_unique_id=f"{chat.id}_{len(messages) + 1}",
+            width=1280,
+            height=960,
+            file_size=photo_size,
+            date=date,
+        )
+        add(
+            photo=photo,
+            media=MessageMediaType.PHOTO,
+            caption=caption,
+            media_group_id=group_id,
+        )
+
+    added = 0
+    while added < photos:
+        post = len(messages)
+        if rand.random() < text_share:
+            add(text=f"Post {post} in {chat.title}")
+            add_photo()
+            added += 1
+        elif rand.random() < group_share:
+            size = min(photos - added, rand.randint(2, 10))
+            for ind in range(size):
+                add_photo(f"Group {post}" if ind == 0 else None, f"{chat.id}_{post}")
+            added += size
+        else:
+            add_photo(f"Photo {post}")
+            added += 1
+    return messages
+
+
+class FakeClient:
+    def __init__(
+        self,
+        histories: dict[int, list[Message]],
+        jpegs: list[bytes],
+        latency: float = 0.0,
+        download_latency: float = 0.0,
+        flood_rate: float = 0.0,
+        flood_seconds: int = 1,
+        seed: int = 0,
+    ):
+        self.histories = histories
+        self.chats = {chat_id: history[0].chat for chat_id, history in histories.items()}
+        self.jpegs = jpegs
+        self.latency = latency
+        self.download_latency = download_latency
+        self.flood_rate = flood_rate
+        self.flood_seconds = flood_seconds
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.floods = 0
+        self.downloaded_bytes = 0
+
+    async def __call(self, method: str, latency: float | None = None):
+        self.calls[method] += 1
+        await asyncio.sleep(self.latency if latency is None else latency)
+        if self.flood_rate and self.random.random() < self.flood_rate:
+            self.floods += 1
+            raise FloodWait(value=self.flood_seconds)
+
+    def __get_message(self, chat_id: int, message_id: int) -> Message | None:
+        history = self.histories[int(chat_id)]
+        if 1 <= message_id <= len(history):
+            return history[message_id - 1]
+
+    async def get_chat_history(
+        self, chat_id: int | str, limit: int = 0, offset: int = 0, offset_id: int = 0
+    ):
+        history = self.histories[int(chat_id)]
+        end = min(len(history), offset_id - 1) if offset_id else len(history)
+        end -= offset
+        start = max(0, end - limit) if limit else 0
+        for ind in range(end - 1, start - 1, -1):
+            if (end - 1 - ind) % 100 == 0:
+                await self.__call("get_chat_history")
+            yield history[ind]
+
+    async def get_dialogs(self):
+        await self.__call("get_dialogs")
+        for chat_id, history in self.histories.items():
+            yield SimpleNamespace(chat=self.chats[chat_id], top_message=history[-1])
+
+    async def get_messages(self, chat_id: int | str, message_ids: list[int]):
+        await self.__call("get_messages")
+        output = []
+        for message_id in message_ids:
+            mes = self.__get_message(chat_id, message_id)
+            output.append(mes if mes is not None else Message(id=message_id, empty=True))
+        return output
+
+    async def get_media_group(self, chat_id: int | str, message_id: int):
+        await self.__call("get_media_group")
+        mes = self.__get_message(chat_id, message_id)
+        if mes is None or not mes.media_group_id:
+            raise ValueError("The message doesn't belong to a media group")
+        return [
+            other
+            for other in self.histories[int(chat_id)]
+            if other.media_group_id == mes.media_group_id
+        ]
+
+    async def download_media(
+        self, file_id: str, file_name: str = "downloads/", in_memory: bool = False
+    ):
+        await self.__call("download_media", self.download_latency)
+        chat_id, message_id = map(int, file_id.rsplit("_", 1))
+        content = self.jpegs[(chat_id + message_id) % len(self.jpegs)]
+        self.downloaded_bytes += len(content)
+        if in_memory:
+            buffer = BytesIO(content)
+            buffer.name = f"{message_id}.jpeg"
+            return buffer
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        with open(file_name, "wb") as f:
+            f.write(content)
+        return file_name
+
+    async def get_chat(self, chat_id: int | str):
+        await self.__call("get_chat")
+        return self.chats[int(chat_id)]
+
+    async def send_message(self, chat_id: int | str, text: str, **kwargs):
+        await self.__call("send_message")
+
+    def add_handler(self, handler, group: int = 0):
+        pass
+
+
+def make_chats(amount: int) -> list[Chat]:
+    return [
+        Chat(
+            id=-1001000000000 - ind,
+            type=ChatType.CHANNEL,
+            title=f"Bench channel {ind}",
+            username=f"bench_{ind}",
+        )
+        for ind in range(amount)
+    ]
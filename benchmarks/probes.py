@@ -0,0 +1,5 @@
+import resource
+
+
+def get_peak_rss_mb() -> float:
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
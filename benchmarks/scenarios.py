@@ -0,0 +1,211 @@
+import os
+import tempfile
+from io import BytesIO
+from profiling import Profiler
+from telegram import UserBot
+from telegram.calls import TelegramCalls
+from telegram.dedup import PhotoIndex
+from telegram.journal import UploadJournal
+from telegram.leases import ChatLeases
+from telegram.media import PhotoStorage
+from telegram.pipeline import RepostPipeline
+from telegram.preprocess import PhotoPreprocessor
+from telegram.scheduler import ChatScheduler
+from telegram.state import SqliteStateStore
+from telegram.stream import PhotoStream
+from vk import VkAlbum
+from .fake_telegram import FakeClient, make_chats, make_history, make_jpegs
+from .vk_server import VkStandIn, redirect_vk_api
+
+SCENARIOS = {
+    "upload": {
+        "kind": "upload",
+        "photos": 300,
+        "vk_latency": 0.02,
+        "upload_latency": 0.05,
+    },
+    "upload_errors": {
+        "kind": "upload",
+        "photos": 300,
+        "vk_latency": 0.02,
+        "upload_latency": 0.05,
+        "error_rates": {6: 0.05, 9: 0.005, 100: 0.02, 200: 0.01},
+    },
+    "repost": {
+        "kind": "repost",
+        "chats": 4,
+        "photos": 150,
+        "tg_latency": 0.01,
+        "download_latency": 0.02,
+        "vk_latency": 0.02,
+        "upload_latency": 0.05,
+    },
+    "repost_flood": {
+        "kind": "repost",
+        "chats": 4,
+        "photos": 150,
+        "tg_latency": 0.01,
+        "download_latency": 0.02,
+        "vk_latency": 0.02,
+        "upload_latency": 0.05,
+        "flood_rate": 0.01,
+    },
+    "repost_accounts": {
+        "kind": "repost",
+        "chats": 4,
+        "photos": 150,
+        "tg_latency": 0.01,
+        "download_latency": 0.02,
+        "vk_latency": 0.02,
+        "upload_latency": 0.05,
+        "requests_per_second": 3,
+        "tokens": ["bench1", "bench2", "bench3"],
+    },
+    "backfill": {
+        "kind": "repost",
+        "chats": 1,
+        "photos": 1500,
+        "tg_latency": 0.01,
+        "download_latency": 0.02,
+        "vk_latency": 0.02,
+        "upload_latency": 0.05,
+        "backfill": True,
+    },
+    "repost_slow_downloads": {
+        "kind": "repost",
+        "chats": 13,
+        "photos": 20,
+        "tg_latency": 0.01,
+        "download_latency": 0.2,
+        "vk_latency": 0.02,
+        "upload_latency": 0.05,
+    },
+}
+
+
+def make_vk_album(url: str, params: dict) -> VkAlbum:
+    with redirect_vk_api(url):
+        return VkAlbum(
+            params.get("tokens", ["bench"]),
+            0.1,
+            0.1,
+            0.1,
+            0.1,
+            0.1,
+            params.get("anti_flood_seconds", 4),
+            3,
+            3,
+            params.get("executor_workers", 4),
+            params.get("requests_per_second", 20),
+            params.get("uploads_per_hour", 100_000),
+            params.get("flood_backoff_seconds", 1),
+            6,
+            3600,
+        )
+
+
+async def run_upload(vk: VkStandIn, params: dict) -> dict:
+    jpegs = make_jpegs(8, (1280, 960))
+    vk_album = make_vk_album(vk.url, params)
+    album = await vk_album.create_album("Bench")
+    photos_data = [
+        (BytesIO(jpegs[ind % len(jpegs)]), f"Photo {ind // 3}")
+        for ind in range(params["photos"])
+    ]
+    await vk_album.upload_photos_pack(album["id"], photos_data)
+    return {"limiter": vk_album.get_limiter_state()}
+
+
+async def run_repost(vk: VkStandIn, params: dict) -> dict:
+    chats = make_chats(params["chats"])
+    histories = {
+        chat.id: make_history(chat, params["photos"], seed=ind)
+        for ind, chat in enumerate(chats)
+    }
+    client = FakeClient(
+        histories,
+        make_jpegs(8, (1280, 960)),
+        latency=params.get("tg_latency", 0),
+        download_latency=params.get("download_latency", 0),
+        flood_rate=params.get("flood_rate", 0),
+    )
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            path = os.path.join(tmp, "state.db")
+            vk_album = make_vk_album(vk.url, params)
+            state = SqliteStateStore(path)
+            for chat in chats:
+                album = await vk_album.create_album(chat.title)
+                state.add_active(chat.id)
+                state.set_album_id(str(chat.id), album["id"])
+                if params.get("backfill"):
+                    state.set_cursor(str(chat.id), len(histories[chat.id]))
+                    state.add_backfill(
+                        {
+                            "chat_id": chat.id,
+                            "offset_id": 0,
+                            "min_id": 0,
+                            "min_date": 0,
+                            "remaining": None,
+                        }
+                    )
+                else:
+                    state.set_cursor(str(chat.id), 0)
+                state.set_chat_meta(
+                    chat.id,
+                    {"title": chat.title, "username": chat.username, "type": "channel"},
+                )
+
+            ub = UserBot(
+                1,
+                "bench",
+                "bench",
+                60,
+                "",
+                "",
+                params.get("download_concurrency", 4),
+                20,
+                params.get("backfill_page_size", 100),
+                vk_album,
+                RepostPipeline(
+                    params.get("queue_size", 4),
+                    params.get("download_workers", 2),
+                    params.get("upload_workers", 2),
+                    params.get("backfill_queue_size", 1),
+                ),
+                PhotoStorage(True, params.get("memory_limit_mb", 64)),
+                PhotoStream(False, 0),
+                state,
+                UploadJournal(path),
+                ChatScheduler(300, 0, 3600, 20),
+                PhotoIndex(params.get("dedup", False), path, False),
+                PhotoPreprocessor(params.get("preprocess", False), 2, 1280, 87, 200),
+                Profiler(False, "profiling.log", 1024, 0, 0.5, 10),
+                ChatLeases(False, path, 120, None),
+                TelegramCalls(
+                    4,
+                    params.get("history_concurrency", 2),
+                    params.get("download_concurrency", 4),
+                    120,
+                ),
+            )
+            ub.app = client
+            ub.chats = {chat.id: chat for chat in chats}
+
+            ub.pipeline.start(ub._UserBot__upload_photos)
+            await ub._UserBot__repost_to_album()
+            while await ub._UserBot__backfill_round():
+                pass
+            await ub.pipeline.stop()
+            ub.preprocessor.close()
+        finally:
+            os.chdir(cwd)
+
+    return {
+        "tg_calls": sum(client.calls.values()),
+        "tg_floods": client.floods,
+        "limiter": vk_album.get_limiter_state(),
+    }
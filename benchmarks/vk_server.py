@@ -0,0 +1,190 @@
+import json
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+import requests
+import vk_api
+from requests.adapters import HTTPAdapter
+
+VK_API_URL = "https://api.vk.com/"
+ERROR_MESSAGES = {
+    6: "Too many requests per second",
+    9: "Flood control",
+    100: "One of the parameters specified was missing or invalid: "
+    "photos_list is invalid",
+    200: "Access denied",
+}
+SAVE_ERRORS = (100, 200)
+
+
+class VkStandIn:
+    def __init__(
+        self,
+        latency: float = 0.0,
+        upload_latency: float = 0.0,
+        error_rates: dict[int, float] | None = None,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.upload_latency = upload_latency
+        self.error_rates = error_rates or {}
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.errors = Counter()
+        self.albums: dict[int, dict] = {}
+        self.photos: dict[int, dict] = {}
+        self.users: dict[str, int] = {}
+        self.uploaded_bytes = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.__get_handler())
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @property
+    def saved(self) -> int:
+        return sum(1 for photo in self.photos.values() if photo["album_id"])
+
+    def __get_handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                path = urlsplit(self.path).path
+                if path == "/upload":
+                    output = stand_in.upload(body)
+                else:
+                    params = {
+                        key: values[0]
+                        for key, values in parse_qs(body.decode()).items()
+                    }
+                    output = stand_in.call(path.rsplit("/", 1)[-1], params)
+                data = json.dumps(output).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def __get_error(self, method: str) -> int | None:
+        for code, rate in self.error_rates.items():
+            if code in SAVE_ERRORS and method != "photos.save":
+                continue
+            if self.random.random() < rate:
+                return code
+
+    def upload(self, body: bytes):
+        time.sleep(self.upload_latency)
+        with self.lock:
+            self.calls["upload"] += 1
+            self.uploaded_bytes += len(body)
+            amount = body.count(b'name="file')
+        return {
+            "server": 1,
+            "photos_list": json.dumps(list(range(amount))),
+            "hash": "bench",
+        }
+
+    def call(self, method: str, params: dict):
+        time.sleep(self.latency)
+        with self.lock:
+            self.calls[method] += 1
+            code = self.__get_error(method)
+            if code is not None:
+                self.errors[code] += 1
+                return {
+                    "error": {
+                        "error_code": code,
+                        "error_msg": ERROR_MESSAGES[code],
+                        "request_params": [],
+                    }
+                }
+            return {"response": self.__respond(method, params)}
+
+    def __add_photo(self, album_id: int, caption: str, owner_id: int):
+        photo_id = len(self.photos) + 1
+        self.photos[photo_id] = {"album_id": album_id, "caption": caption}
+        return {"id": photo_id, "owner_id": owner_id, "album_id": album_id}
+
+    def __respond(self, method: str, params: dict):
+        token = params.get("access_token")
+        user_id = self.users.setdefault(token, len(self.users) + 1)
+        if method == "users.get":
+            return [{"id": user_id, "first_name": "Bench", "last_name": "User"}]
+        if method == "photos.getAlbums":
+            items = [
+                album for album in self.albums.values() if album["owner_id"] == user_id
+            ]
+            return {"count": len(items), "items": items}
+        if method == "photos.createAlbum":
+            album = {
+                "id": len(self.albums) + 1,
+                "owner_id": user_id,
+                "title": params["title"],
+            }
+            self.albums[album["id"]] = album
+            return album
+        if method == "photos.deleteAlbum":
+            self.albums.pop(int(params["album_id"]), None)
+            return 1
+        if method == "photos.getUploadServer":
+            return {"upload_url": f"{self.url}/upload?album={params['album_id']}"}
+        if method == "photos.save":
+            amount = len(json.loads(params["photos_list"]))
+            return [
+                self.__add_photo(
+                    int(params["album_id"]), params.get("caption", ""), user_id
+                )
+                for _ in range(amount)
+            ]
+        if method == "photos.copy":
+            return self.__add_photo(0, "", user_id)["id"]
+        if method == "photos.move":
+            self.photos[int(params["photo_id"])]["album_id"] = int(
+                params["target_album_id"]
+            )
+            return 1
+        if method == "photos.edit":
+            self.photos[int(params["photo_id"])]["caption"] = params.get("caption", "")
+            return 1
+        raise ValueError(f"unknown method: {method}")
+
+
+class RedirectAdapter(HTTPAdapter):
+    def __init__(self, url: str):
+        super().__init__()
+        self.url = url
+
+    def send(self, request, **kwargs):
+        request.url = self.url + "/" + request.url[len(VK_API_URL) :]
+        return super().send(request, **kwargs)
+
+
+@contextmanager
+def redirect_vk_api(url: str):
+    class Session(requests.Session):
+        def __init__(self):
+            super().__init__()
+            self.mount(VK_API_URL, RedirectAdapter(url))
+
+    with mock.patch.object(vk_api.vk_api.requests, "Session", Session):
+        yield
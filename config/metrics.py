@@ -0,0 +1,10 @@
+from . import c
+
+
+_SECTION = "metrics"
+
+ENABLED = c.getboolean(_SECTION, "enabled")
+HOST = c.get(_SECTION, "host")
+PORT = c.getint(_SECTION, "port")
+
+EXPORTER_ARGS = [ENABLED, HOST, PORT]
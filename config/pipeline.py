@@ -0,0 +1,36 @@
+from . import c
+
+
+_SECTION = "pipeline"
+
+QUEUE_SIZE = c.getint(_SECTION, "queue_size")
+BACKFILL_QUEUE_SIZE = c.getint(_SECTION, "backfill_queue_size")
+DOWNLOAD_WORKERS = c.getint(_SECTION, "download_workers")
+UPLOAD_WORKERS = c.getint(_SECTION, "upload_workers")
+IN_MEMORY = c.getboolean(_SECTION, "in_memory")
+MEMORY_LIMIT_MB = c.getint(_SECTION, "memory_limit_mb")
+CHAT_FAILURE_BACKOFF = c.getint(_SECTION, "chat_failure_backoff")
+MIN_POLL_INTERVAL = c.getint(_SECTION, "min_poll_interval")
+MAX_POLL_INTERVAL = c.getint(_SECTION, "max_poll_interval")
+POLL_TARGET_MESSAGES = c.getint(_SECTION, "poll_target_messages")
+PREPROCESS = c.getboolean(_SECTION, "preprocess")
+PREPROCESS_WORKERS = c.getint(_SECTION, "preprocess_workers")
+MAX_EDGE = c.getint(_SECTION, "max_edge")
+JPEG_QUALITY = c.getint(_SECTION, "jpeg_quality")
+PREPROCESS_MIN_KB = c.getint(_SECTION, "preprocess_min_kb")
+
+PIPELINE_ARGS = [QUEUE_SIZE, DOWNLOAD_WORKERS, UPLOAD_WORKERS, BACKFILL_QUEUE_SIZE]
+STORAGE_ARGS = [IN_MEMORY, MEMORY_LIMIT_MB]
+SCHEDULER_ARGS = [
+    CHAT_FAILURE_BACKOFF,
+    MIN_POLL_INTERVAL,
+    MAX_POLL_INTERVAL,
+    POLL_TARGET_MESSAGES,
+]
+PREPROCESS_ARGS = [
+    PREPROCESS,
+    PREPROCESS_WORKERS,
+    MAX_EDGE,
+    JPEG_QUALITY,
+    PREPROCESS_MIN_KB,
+]
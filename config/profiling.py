@@ -0,0 +1,12 @@
+from . import c
+
+
+_SECTION = "profiling"
+
+REPORT_PATH = c.get(_SECTION, "report_path")
+MAX_KB = c.getint(_SECTION, "max_kb")
+BACKUPS = c.getint(_SECTION, "backups")
+LAG_INTERVAL = c.getfloat(_SECTION, "lag_interval")
+TOP_ALLOCATIONS = c.getint(_SECTION, "top_allocations")
+
+PROFILER_ARGS = [REPORT_PATH, MAX_KB, BACKUPS, LAG_INTERVAL, TOP_ALLOCATIONS]
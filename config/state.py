@@ -0,0 +1,13 @@
+from . import c
+
+
+_SECTION = "state"
+
+BACKEND = c.get(_SECTION, "backend")
+PATH = c.get(_SECTION, "path")
+DEDUP = c.getboolean(_SECTION, "dedup")
+PERCEPTUAL_HASH = c.getboolean(_SECTION, "perceptual_hash")
+
+STATE_ARGS = [BACKEND, PATH]
+JOURNAL_ARGS = [PATH]
+INDEX_ARGS = [DEDUP, PATH, PERCEPTUAL_HASH]
@@ -8,5 +8,30 @@ SESSION_NAME = c.get(_SECTION, "session_name")
 INTERVAL = c.getint(_SECTION, "interval")
 PHONE_NUMBER = c.get(_SECTION, "phone_number")
 PASSWORD = c.get(_SECTION, "password")
+STREAMING = c.getboolean(_SECTION, "streaming")
+MEDIA_GROUP_WAIT = c.getfloat(_SECTION, "media_group_wait")
+RESOLVE_CONCURRENCY = c.getint(_SECTION, "resolve_concurrency")
+DOWNLOAD_CONCURRENCY = c.getint(_SECTION, "download_concurrency")
+HISTORY_CONCURRENCY = c.getint(_SECTION, "history_concurrency")
+FLOOD_MAX_WAIT = c.getint(_SECTION, "flood_max_wait")
+LIMIT = c.getint(_SECTION, "limit")
+BACKFILL_PAGE_SIZE = c.getint(_SECTION, "backfill_page_size")
 
-UB_ARGS = [API_ID, API_HASH, SESSION_NAME, INTERVAL, PHONE_NUMBER, PASSWORD]
+UB_ARGS = [
+    API_ID,
+    API_HASH,
+    SESSION_NAME,
+    INTERVAL,
+    PHONE_NUMBER,
+    PASSWORD,
+    DOWNLOAD_CONCURRENCY,
+    LIMIT,
+    BACKFILL_PAGE_SIZE,
+]
+STREAM_ARGS = [STREAMING, MEDIA_GROUP_WAIT]
+CALLS_ARGS = [
+    RESOLVE_CONCURRENCY,
+    HISTORY_CONCURRENCY,
+    DOWNLOAD_CONCURRENCY,
+    FLOOD_MAX_WAIT,
+]
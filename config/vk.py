@@ -3,7 +3,7 @@ from . import c
 
 _SECTION = "vk"
 
-TOKEN = c.get(_SECTION, "token")
+TOKENS = [token.strip() for token in c.get(_SECTION, "token").split(",")]
 RETRY_SECONDS = c.getint(_SECTION, "retry_seconds")
 JSON_DECODE_RS = c.getint(_SECTION, "json_decode_retry_seconds")
 UPLOAD_FAIL_RS = c.getint(_SECTION, "upload_fail_retry_seconds")
@@ -12,9 +12,15 @@ ACCESS_DENIED_RS = c.getint(_SECTION, "access_denied_retry_seconds")
 ANTI_FLOOD_RS = c.getint(_SECTION, "anti_flood_retry_seconds")
 PHOTO_UPLOAD_MAX_TRIES = c.getint(_SECTION, "photo_upload_max_tries")
 PACK_UPLOAD_MAX_TRIES = c.getint(_SECTION, "pack_upload_max_tries")
+EXECUTOR_WORKERS = c.getint(_SECTION, "executor_workers")
+REQUESTS_PER_SECOND = c.getfloat(_SECTION, "requests_per_second")
+UPLOADS_PER_HOUR = c.getint(_SECTION, "uploads_per_hour")
+FLOOD_BACKOFF_SECONDS = c.getint(_SECTION, "flood_backoff_seconds")
+RATE_LIMIT_MAX_TRIES = c.getint(_SECTION, "rate_limit_max_tries")
+ALBUMS_TTL = c.getint(_SECTION, "albums_ttl")
 
 ALBUM_ARGS = [
-    TOKEN,
+    TOKENS,
     RETRY_SECONDS,
     JSON_DECODE_RS,
     UPLOAD_FAIL_RS,
@@ -23,4 +29,10 @@ ALBUM_ARGS = [
     ANTI_FLOOD_RS,
     PHOTO_UPLOAD_MAX_TRIES,
     PACK_UPLOAD_MAX_TRIES,
+    EXECUTOR_WORKERS,
+    REQUESTS_PER_SECOND,
+    UPLOADS_PER_HOUR,
+    FLOOD_BACKOFF_SECONDS,
+    RATE_LIMIT_MAX_TRIES,
+    ALBUMS_TTL,
 ]
@@ -0,0 +1,13 @@
+from . import c
+from .state import BACKEND, PATH
+
+
+_SECTION = "workers"
+
+ENABLED = c.getboolean(_SECTION, "enabled")
+LEASE_SECONDS = c.getint(_SECTION, "lease_seconds")
+
+if ENABLED and BACKEND != "sqlite":
+    raise ValueError("workers require the sqlite state backend")
+
+LEASES_ARGS = [ENABLED, PATH, LEASE_SECONDS]
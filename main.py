@@ -2,15 +2,66 @@ import asyncio
 import logging
 import sys
 
-from config.telegram import UB_ARGS
+from config.metrics import EXPORTER_ARGS
+from config.pipeline import (
+    PIPELINE_ARGS,
+    PREPROCESS_ARGS,
+    SCHEDULER_ARGS,
+    STORAGE_ARGS,
+)
+from config.profiling import PROFILER_ARGS
+from config.state import INDEX_ARGS, JOURNAL_ARGS, STATE_ARGS
+from config.telegram import CALLS_ARGS, STREAM_ARGS, UB_ARGS
 from config.vk import ALBUM_ARGS
+from config.workers import ENABLED as WORKERS_ENABLED, LEASES_ARGS
+from metrics.exporter import MetricsExporter
+from profiling import Profiler
 from telegram import UserBot
+from telegram.calls import TelegramCalls
+from telegram.dedup import PhotoIndex
+from telegram.journal import UploadJournal
+from telegram.leases import ChatLeases
+from telegram.media import PhotoStorage
+from telegram.pipeline import RepostPipeline
+from telegram.preprocess import PhotoPreprocessor
+from telegram.scheduler import ChatScheduler
+from telegram.state import get_state_store
+from telegram.stream import PhotoStream
 from vk import VkAlbum
 
 
-async def main():
+async def main(is_profiling: bool, worker_id: str | None):
     vk_album = VkAlbum(*ALBUM_ARGS)
-    ub = UserBot(*UB_ARGS, vk_album)
+    pipeline = RepostPipeline(*PIPELINE_ARGS)
+    storage = PhotoStorage(*STORAGE_ARGS)
+    stream = PhotoStream(*STREAM_ARGS)
+    state = get_state_store(*STATE_ARGS)
+    journal = UploadJournal(*JOURNAL_ARGS)
+    scheduler = ChatScheduler(*SCHEDULER_ARGS)
+    photo_index = PhotoIndex(*INDEX_ARGS)
+    preprocessor = PhotoPreprocessor(*PREPROCESS_ARGS)
+    profiler = Profiler(is_profiling, *PROFILER_ARGS)
+    leases = ChatLeases(*LEASES_ARGS, worker_id)
+    calls = TelegramCalls(*CALLS_ARGS)
+    ub_args = list(UB_ARGS)
+    if worker_id is not None:
+        # each worker needs its own pyrogram session file
+        ub_args[2] = f"{ub_args[2]}_{worker_id}"
+    ub = UserBot(
+        *ub_args,
+        vk_album,
+        pipeline,
+        storage,
+        stream,
+        state,
+        journal,
+        scheduler,
+        photo_index,
+        preprocessor,
+        profiler,
+        leases,
+        calls,
+    )
     logging.info("Disabling pyrogram logging...")
     for name, logger in logging.root.manager.loggerDict.items():
         if name.startswith(("pyrogram.session", "pyrogram.connection")) and isinstance(
@@ -21,6 +72,10 @@ async def main():
     logging.info("Logging was disabled")
     # ub.app.run()
     await ub.app.start()
+    exporter = MetricsExporter(*EXPORTER_ARGS)
+    if leases.is_coordinator:
+        await exporter.start()
+    profiler.start()
     try:
         # Устанавливаем флаг и запускаем один раз
         ub.is_started = True 
@@ -29,14 +84,29 @@ async def main():
             asyncio.Event().wait()
         )
     finally:
+        leases.release()
+        await profiler.stop()
+        await exporter.stop()
         await ub.app.stop()
 
 
+def get_worker_id() -> str | None:
+    args = sys.argv[1:]
+    if "-w" not in args:
+        return None
+    ind = args.index("-w") + 1
+    if ind >= len(args) or not WORKERS_ENABLED:
+        sys.exit("-w {worker_id} requires `enabled = yes` in the [workers] section")
+    return args[ind]
+
+
 if __name__ == "__main__":
-    is_debug = sys.argv[1:] and sys.argv[1] == "-d"
+    is_debug = "-d" in sys.argv[1:]
+    is_profiling = "-p" in sys.argv[1:]
+    worker_id = get_worker_id()
     logging_lvl = logging.DEBUG if is_debug else logging.INFO
     logging.basicConfig(level=logging_lvl)
     try:
-        asyncio.run(main())
+        asyncio.run(main(is_profiling, worker_id))
     except KeyboardInterrupt:
         sys.exit(0)
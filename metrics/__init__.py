@@ -0,0 +1,195 @@
+import math
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+CYCLE_BUCKETS = (10, 30, 60, 300, 900, 1800, 3600, 7200)
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...], extra: str = "") -> str:
+    parts = [f'{key}="{value}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values: dict[tuple[tuple[str, str], ...], float] = {}
+
+    @staticmethod
+    def _key(labels: dict) -> tuple[tuple[str, str], ...]:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def get(self, **labels) -> float:
+        return self.values.get(self._key(labels), 0)
+
+    def get_total(self) -> float:
+        return sum(self.values.values())
+
+    def get_by(self, label: str) -> dict[str, float]:
+        output = {}
+        for key, value in self.values.items():
+            label_value = dict(key).get(label)
+            output[label_value] = output.get(label_value, 0) + value
+        return output
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        self.values[self._key(labels)] = value
+
+    def clear(self):
+        self.values.clear()
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = (*buckets, math.inf)
+        self.counts: dict[tuple[tuple[str, str], ...], list[int]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        counts = self.counts.setdefault(key, [0] * len(self.buckets))
+        for ind, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[ind] += 1
+        self.values[key] = self.values.get(key, 0) + value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started, **labels)
+
+    def get_count(self, **labels) -> int:
+        counts = self.counts.get(self._key(labels))
+        return counts[-1] if counts else 0
+
+    def get_mean(self, **labels) -> float:
+        count = self.get_count(**labels)
+        return self.get(**labels) / count if count else 0
+
+    def get_means_by(self, label: str) -> dict[str, float]:
+        sums, counts = {}, {}
+        for key, value in self.values.items():
+            label_value = dict(key).get(label)
+            sums[label_value] = sums.get(label_value, 0) + value
+            counts[label_value] = counts.get(label_value, 0) + self.counts[key][-1]
+        return {key: sums[key] / counts[key] for key in sums if counts[key]}
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for key, counts in sorted(self.counts.items()):
+            for bound, count in zip(self.buckets, counts):
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(key, le)} {count}")
+            labels = _format_labels(key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(self.values[key])}")
+            lines.append(f"{self.name}_count{labels} {counts[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+        self.started_at = time.time()
+
+    def __add(self, metric: Metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self.__add(Counter(name, help))
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self.__add(Gauge(name, help))
+
+    def histogram(
+        self, name: str, help: str, buckets: tuple = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self.__add(Histogram(name, help, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+PHOTOS_DOWNLOADED = registry.counter(
+    "repost_photos_downloaded_total", "Photos downloaded from Telegram"
+)
+PHOTOS_UPLOADED = registry.counter(
+    "repost_photos_uploaded_total", "Photos saved to VK albums"
+)
+PHOTOS_DEDUPLICATED = registry.counter(
+    "repost_photos_deduplicated_total", "Duplicate photos copied or skipped"
+)
+DOWNLOADED_BYTES = registry.counter(
+    "repost_downloaded_bytes_total", "Bytes downloaded from Telegram"
+)
+UPLOADED_BYTES = registry.counter(
+    "repost_uploaded_bytes_total", "Bytes uploaded to VK upload servers"
+)
+VK_REQUEST_SECONDS = registry.histogram(
+    "repost_vk_request_seconds", "VK API call latency by method"
+)
+VK_ERRORS = registry.counter("repost_vk_errors_total", "VK API errors by code")
+VK_RETRIES = registry.counter(
+    "repost_vk_retries_total", "Retried VK calls and uploads by reason"
+)
+VK_THROTTLE_SECONDS = registry.counter(
+    "repost_vk_throttle_seconds_total", "Time spent waiting on the VK rate limiter"
+)
+TG_REQUEST_SECONDS = registry.histogram(
+    "repost_telegram_request_seconds", "Telegram call latency by method"
+)
+TG_FLOOD_WAITS = registry.counter(
+    "repost_telegram_flood_waits_total", "Telegram FloodWait errors"
+)
+TG_FLOOD_WAIT_SECONDS = registry.counter(
+    "repost_telegram_flood_wait_seconds_total", "Seconds requested by FloodWait errors"
+)
+CYCLE_SECONDS = registry.histogram(
+    "repost_cycle_seconds", "Duration of a full reposting cycle", CYCLE_BUCKETS
+)
+CHAT_BACKLOG = registry.gauge(
+    "repost_chat_backlog", "Photos found but not yet saved, per chat"
+)
+PIPELINE_PENDING = registry.gauge(
+    "repost_pipeline_pending", "Upload items queued or in progress"
+)
@@ -0,0 +1,50 @@
+import asyncio
+import logging
+from . import registry
+
+
+class MetricsExporter:
+    def __init__(self, enabled: bool, host: str, port: int):
+        self.enabled = enabled
+        self.host = host
+        self.port = port
+        self.server: asyncio.AbstractServer | None = None
+
+    async def start(self):
+        if not self.enabled or self.server is not None:
+            return
+        self.server = await asyncio.start_server(self.__handle, self.host, self.port)
+        logging.info(msg=f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self.server is None:
+            return
+        self.server.close()
+        await self.server.wait_closed()
+        self.server = None
+
+    async def __handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            line = request
+            while line not in (b"\r\n", b"\n", b""):
+                line = await asyncio.wait_for(reader.readline(), 5)
+            parts = request.decode(errors="replace").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1] == "/metrics":
+                status, body = "200 OK", registry.render()
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+            else:
+                status, body, content_type = "404 Not Found", "not found\n", "text/plain"
+            data = body.encode()
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode()
+                + data
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
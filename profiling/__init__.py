@@ -0,0 +1,141 @@
+import asyncio
+import json
+import logging
+import time
+import tracemalloc
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+import psutil
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.lags: list[float] = []
+        self.task: asyncio.Task | None = None
+        self.is_skipping = False
+
+    async def __run(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            if self.is_skipping:
+                self.is_skipping = False
+                continue
+            self.lags.append(max(0.0, time.monotonic() - started - self.interval))
+
+    def skip(self):
+        # the profiler's own pause would be counted against the loop
+        self.is_skipping = True
+
+    def start(self):
+        self.task = asyncio.create_task(self.__run())
+
+    async def stop(self):
+        if self.task is None:
+            return
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        self.task = None
+
+    def get_stats(self, reset: bool = False) -> dict:
+        lags = sorted(self.lags) or [0.0]
+        if reset:
+            self.lags = []
+        return {
+            "loop_lag_max_ms": round(lags[-1] * 1000, 2),
+            "loop_lag_p95_ms": round(lags[int(len(lags) * 0.95)] * 1000, 2),
+        }
+
+
+class Profiler:
+    def __init__(
+        self,
+        enabled: bool,
+        report_path: str,
+        max_kb: int,
+        backups: int,
+        lag_interval: float,
+        top_allocations: int,
+    ):
+        self.enabled = enabled
+        self.top_allocations = top_allocations
+        self.monitor = LoopLagMonitor(lag_interval)
+        self.process = psutil.Process()
+        self.report = logging.getLogger("profiling")
+        self.report.propagate = False
+        if enabled:
+            handler = RotatingFileHandler(
+                report_path, maxBytes=max_kb * 1024, backupCount=backups
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self.report.addHandler(handler)
+            self.report.setLevel(logging.INFO)
+
+    def start(self):
+        if not self.enabled:
+            return
+        tracemalloc.start()
+        self.monitor.start()
+        logging.info(msg="Profiling is enabled")
+
+    async def stop(self):
+        if not self.enabled:
+            return
+        await self.monitor.stop()
+        tracemalloc.stop()
+
+    def __write(self, record: dict):
+        record["time"] = round(time.time(), 3)
+        self.report.info(json.dumps(record, ensure_ascii=False))
+
+    def __get_top(self, before: tracemalloc.Snapshot, after: tracemalloc.Snapshot):
+        stats = after.compare_to(before, "lineno")[: self.top_allocations]
+        return [
+            {
+                "where": str(stat.traceback[0]),
+                "size_kb": round(stat.size_diff / 1024, 1),
+                "count": stat.count_diff,
+            }
+            for stat in stats
+        ]
+
+    def __take_snapshot(self) -> tracemalloc.Snapshot:
+        self.monitor.skip()
+        return tracemalloc.take_snapshot()
+
+    def __get_open_files(self) -> int:
+        if hasattr(self.process, "num_fds"):
+            return self.process.num_fds()
+        return self.process.num_handles()
+
+    @contextmanager
+    def profile(self, name: str, reset: bool = False):
+        if not self.enabled or not tracemalloc.is_tracing():
+            yield
+            return
+
+        # snapshots block the loop, so allocations are compared per cycle only
+        if reset:
+            tracemalloc.reset_peak()
+            before = self.__take_snapshot()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            duration = time.monotonic() - started
+            current, peak = tracemalloc.get_traced_memory()
+            memory = self.process.memory_info()
+            record = {
+                "event": name,
+                "duration_s": round(duration, 3),
+                "rss_mb": round(memory.rss / 1024 / 1024, 1),
+                "open_fds": self.__get_open_files(),
+                "traced_mb": round(current / 1024 / 1024, 2),
+            }
+            record.update(self.monitor.get_stats(reset))
+            # nested and concurrent spans share the peak of the enclosing cycle
+            if reset:
+                record["traced_peak_mb"] = round(peak / 1024 / 1024, 2)
+                record["top"] = self.__get_top(before, self.__take_snapshot())
+            self.__write(record)
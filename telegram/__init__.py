@@ -1,17 +1,50 @@
 import asyncio
 import json
 import os
+import sqlite3
+import time
 import telegram.utils as utils
 import logging
+from collections import deque
+from functools import partial
 from shutil import rmtree
-from datetime import timedelta
+from io import BytesIO
 from pyrogram import Client, filters
-from pyrogram.enums import MessageMediaType
+from pyrogram.enums import ChatType
 from pyrogram.types import Message, Chat
 from pyrogram.handlers.message_handler import MessageHandler
 from pyrogram.errors.exceptions import bad_request_400, flood_420
 from pyrogram.errors import exceptions
-from vk import VkAlbum
+from metrics import (
+    CHAT_BACKLOG,
+    CYCLE_SECONDS,
+    DOWNLOADED_BYTES,
+    PHOTOS_DEDUPLICATED,
+    PHOTOS_DOWNLOADED,
+    PHOTOS_UPLOADED,
+    TG_FLOOD_WAIT_SECONDS,
+    TG_FLOOD_WAITS,
+    TG_REQUEST_SECONDS,
+    UPLOADED_BYTES,
+    VK_ERRORS,
+    VK_REQUEST_SECONDS,
+    VK_THROTTLE_SECONDS,
+    registry,
+)
+from profiling import Profiler
+from vk import VkAlbum, UPLOAD_BATCH_SIZE
+from .calls import DOWNLOAD, HISTORY, MESSAGES, RESOLVE, TelegramCalls
+from .captions import CAPTION_ERROR, CONTEXT_MESSAGES, CaptionResolver
+from .dedup import PhotoIndex
+from .journal import DOWNLOADED, SAVED, UPLOADED, UploadJournal
+from .leases import ChatLeases
+from .media import PhotoStorage
+from .pipeline import RepostPipeline
+from .preprocess import PhotoPreprocessor
+from .records import MessageRecord
+from .scheduler import ChatScheduler
+from .state import StateStore
+from .stream import PhotoStream
 
 with open("telegram/commands.json", "r") as f:
     bot_texts: dict = json.load(f)
@@ -28,17 +61,55 @@ class UserBot:
         interval: int,
         phone_number: str,
         password: str,
+        download_concurrency: int,
+        limit: int,
+        backfill_page_size: int,
         vk_album: VkAlbum,
+        pipeline: RepostPipeline,
+        storage: PhotoStorage,
+        stream: PhotoStream,
+        state: StateStore,
+        journal: UploadJournal,
+        scheduler: ChatScheduler,
+        photo_index: PhotoIndex,
+        preprocessor: PhotoPreprocessor,
+        profiler: Profiler,
+        leases: ChatLeases,
+        calls: TelegramCalls,
     ):
-        if "chats_data.json" not in os.listdir("telegram"):
-            self.__update_chats_data({"active": [], "posted": {}, "albums_ids": {}})
-        self.chats_ids = self.__get_chats_data()["active"]
+        self.state = state
+        self.journal = journal
+        self.scheduler = scheduler
+        self.photo_index = photo_index
+        self.preprocessor = preprocessor
+        self.profiler = profiler
+        self.leases = leases
+        self.calls = calls
+        self.leases_task: asyncio.Task | None = None
+        self.backfill_task: asyncio.Task | None = None
+        self.backfill_wakeup = asyncio.Event()
+        self.cycle_wakeup = asyncio.Event()
+        self.is_paused = False
+        self.live_idle = asyncio.Event()
+        self.live_idle.set()
+        self.limit = limit
+        self.backfill_page_size = backfill_page_size
+        self.in_flight: set[tuple[int, int]] = set()
+        self.photo_hashes: dict[tuple[int, int], tuple[str, str | None]] = {}
+        self.chats_ids = self.state.get_active()
         self.chats = {chat_id: None for chat_id in self.chats_ids}
-        self.albums_ids = self.__get_albums_ids()
+        self.albums_ids = self.state.get_albums_ids()
         self.handlers_funcs = self.__get_handlers_funcs()
-        self.interval = interval
+        self.scheduler.reset(interval)
+        self.interval = int(self.scheduler.interval)
         self.vk_album = vk_album
-        self.retry_seconds = 30
+        self.__load_albums_owners()
+        self.pipeline = pipeline
+        self.storage = storage
+        self.stream = stream
+        self.chat_locks: dict[str, asyncio.Lock] = {}
+        self.top_messages_ids: dict[int, int] = {}
+        self.download_concurrency = download_concurrency
         self.is_started = False
         self.app = Client(
             session_name,
@@ -46,8 +117,19 @@ class UserBot:
             api_hash=api_hash,
             phone_number=phone_number,
             password=password,
+            max_concurrent_transmissions=download_concurrency,
         )
-        self.app.add_handler(MessageHandler(self.__handler_wrapper, filters.me))
+        if self.leases.is_coordinator:
+            self.app.add_handler(MessageHandler(self.__handler_wrapper, filters.me))
+        if self.stream.enabled:
+            is_tracked = filters.create(
+                lambda _, __, msg: msg.chat is not None
+                and msg.chat.id in self.chats
+                and self.leases.is_owned(msg.chat.id)
+            )
+            self.app.add_handler(
+                MessageHandler(self.__stream_handler, is_tracked), group=1
+            )
 
     def __get_handler_by_text(self, text: str):
         command = text.split()[0][1:]
@@ -65,20 +147,19 @@ class UserBot:
             kwargs = await handler(client, msg)  # calling the handler
 
         except flood_420.FloodWait as err:
-            seconds = err.__str__().split("of ", 1)[-1].split()[0]
-            text = bot_errors["flood_wait"].format(seconds=seconds)
-            await self.app.send_message("me", text)
+            text = bot_errors["flood_wait"].format(seconds=err.value)
+            await self.__send_message(text)
             return
 
         except exceptions.RPCError as err:
             logging.error(err)
             self.is_started = False
             text = bot_errors["rpc_error"].format(error=err.__str__())
-            await self.app.send_message("me", text)
+            await self.__send_message(text)
             return
 
         f_data = kwargs.pop("func_data") if "func_data" in kwargs else None
-        await msg.edit(**kwargs)
+        await self.calls.call(MESSAGES, msg.edit, **kwargs)
 
         if not f_data:
             return
@@ -132,7 +213,9 @@ class UserBot:
             return {"text": text}
 
         self.is_started = False
-        interval = utils.format_interval(self.interval)
+        self.state.set_meta("is_started", "0")
+        sleep = self.scheduler.get_sleep(self.__get_owned_chats())
+        interval = utils.format_interval(sleep)
 
         text = bot_texts["stop"].format(interval=interval)
         return {"text": text}
@@ -145,7 +228,9 @@ class UserBot:
         
         try:
             prev = utils.format_interval(self.interval)
-            self.interval = int(arg) * 60
+            self.scheduler.reset(int(arg) * 60)
+            self.interval = int(self.scheduler.interval)
+            self.state.set_meta("interval", str(self.interval))
             cur = utils.format_interval(self.interval)
 
             text = bot_texts["interval"].format(prev=prev, cur=cur)
@@ -154,6 +239,82 @@ class UserBot:
 
         return {"text": text}
 
+    async def __schedule_handler(self, client: Client, msg: Message):
+        if None in self.chats.values():
+            self.chats = await self.__get_chats()
+
+        schedule = self.scheduler.get_schedule(self.__get_owned_chats())
+        chats_schedule = utils.get_schedule_descs(
+            [
+                (self.chats[chat_id], interval, due_in, rate)
+                for chat_id, interval, due_in, rate in schedule
+                if self.chats[chat_id] is not None
+            ]
+        )
+
+        text = bot_texts["schedule"].format(schedule=chats_schedule)
+        kwargs = {"text": text, "disable_web_page_preview": True}
+
+        return kwargs
+
+    async def __stats_handler(self, client: Client, msg: Message):
+        vk_errors = VK_ERRORS.get_by("code")
+        throttle_seconds = VK_THROTTLE_SECONDS.get_total()
+        flood_seconds = TG_FLOOD_WAIT_SECONDS.get_total()
+        if throttle_seconds > flood_seconds:
+            bottleneck = bot_texts["bottlenecks"]["vk"]
+        elif flood_seconds > 0:
+            bottleneck = bot_texts["bottlenecks"]["telegram"]
+        else:
+            bottleneck = bot_texts["bottlenecks"]["none"]
+
+        text = bot_texts["stats"].format(
+            uptime=utils.format_interval(int(time.time() - registry.started_at)),
+            downloaded=int(PHOTOS_DOWNLOADED.get_total()),
+            downloaded_mb=utils.format_mb(DOWNLOADED_BYTES.get_total()),
+            uploaded=int(PHOTOS_UPLOADED.get_total()),
+            uploaded_mb=utils.format_mb(UPLOADED_BYTES.get_total()),
+            deduplicated=int(PHOTOS_DEDUPLICATED.get_total()),
+            cycle=utils.format_interval(int(CYCLE_SECONDS.get_mean())),
+            backlog=int(CHAT_BACKLOG.get_total()),
+            vk_latency=utils.format_latencies(
+                VK_REQUEST_SECONDS.get_means_by("method")
+            ),
+            vk_errors=utils.format_counts(vk_errors),
+            vk_throttle=int(throttle_seconds),
+            flood_waits=int(TG_FLOOD_WAITS.get_total()),
+            flood_seconds=int(flood_seconds),
+            bottleneck=bottleneck,
+        )
+        return {"text": text}
+
+    async def __backfill_handler(self, client: Client, msg: Message):
+        try:
+            _, args = tuple(msg.text.split(" ", 1))
+            arg, limit = tuple(args.rsplit(" ", 1))
+        except ValueError:
+            return {"text": bot_errors["missing_arguments"].format(command=msg.text)}
+
+        try:
+            remaining, min_date = utils.parse_backfill_limit(limit)
+        except ValueError:
+            return {"text": bot_errors["invalid_argument"].format(arg=limit)}
+
+        try:
+            if arg.startswith("@"):
+                chat_id = (await self.__get_chat(arg)).id
+            else:
+                chat_id = await self.__get_chat_id_by_title(arg)
+        except (bad_request_400.UsernameInvalid, bad_request_400.UsernameNotOccupied):
+            return {"text": bot_errors["invalid_username"].format(username=arg)}
+        if chat_id not in self.chats or str(chat_id) not in self.albums_ids:
+            return {"text": bot_errors["not_found"].format(username=arg)}
+
+        self.__add_backfill(chat_id, min_date=min_date, remaining=remaining)
+        logging.info(msg=f"Added backfill of {chat_id}: {limit}")
+        text = bot_texts["backfill"].format(username=arg, limit=limit)
+        return {"text": text}
+
     async def __add_handler(self, client: Client, msg: Message):
         if None in self.chats.values():
             self.chats = await self.__get_chats()
@@ -190,17 +351,22 @@ class UserBot:
             self.chats = await self.__get_chats()
         successful = []
         unsuccessful = []
-        for username in usernames:
+
+        async def add(username: str):
             try:
-                res = await self.__add_chat(username)
-                if res:
-                    logging.info(msg=f"Added new chat: {username}")
-                    successful.append(username)
-                    await asyncio.sleep(1.25)
+                return await self.__add_chat(username)
             except (
                 bad_request_400.UsernameInvalid,
                 bad_request_400.UsernameNotOccupied,
             ):
+                return False
+
+        results = await asyncio.gather(*[add(username) for username in usernames])
+        for username, res in zip(usernames, results):
+            if res:
+                logging.info(msg=f"Added new chat: {username}")
+                successful.append(username)
+            elif res is False:
                 unsuccessful.append(username)
 
         template = bot_texts["multiple_add"].split("\n", 2)
@@ -280,22 +446,23 @@ class UserBot:
             raise AttributeError("chat_id or chat must be filled")
         try:
             if chat is None:
-                chat = await self.app.get_chat(chat_id)
+                chat = await self.__get_chat(chat_id)
 
-            posted = self.__get_posted()
             is_added = False
             if chat.id not in self.chats:
                 self.chats.setdefault(chat.id, chat)
-                self.__save_active_chats(list(self.chats.keys()))
-                is_added = True
-            if str(chat.id) not in posted:
-                posted.setdefault(chat.id, [])
-                self.__save_posted(posted)
+                self.state.add_active(chat.id)
                 is_added = True
 
-            album = await self.vk_album.get_album_by_title(chat.title)
+            album = None
+            if str(chat.id) in self.albums_ids:
+                album = await self.vk_album.get_album_by_id(
+                    self.albums_ids[str(chat.id)]
+                )
+            if album is None:
+                album = await self.vk_album.get_album_by_title(chat.title, chat.id)
             if album is None:
-                album = await self.vk_album.create_album(chat.title)
+                album = await self.vk_album.create_album(chat.title, chat.id)
                 logging.info(f"Created new album: {chat.title}")
             if str(chat.id) in self.albums_ids:
                 self.albums_ids[str(chat.id)] = album["id"]
@@ -303,94 +470,434 @@ class UserBot:
             else:
                 self.albums_ids.setdefault(str(chat.id), album["id"])
                 is_added = True
-            self.__save_albums_ids()
+            self.state.set_album_id(str(chat.id), album["id"])
+            self.state.set_album_owner(
+                str(chat.id), self.vk_album.get_owner_id(album["id"])
+            )
 
             return is_added
-        except flood_420.FloodWait as err:
-            seconds = int(err.__str__().split("of ", 1)[-1].split()[0])
-            await asyncio.sleep(seconds)
-            await self.__add_chat(chat_id)
         except ValueError:
-            await self.app.send_message(
-                "me", bot_errors["not_joined"].format(chat_id=chat_id)
-            )
+            await self.__send_message(bot_errors["not_joined"].format(chat_id=chat_id))
 
     async def __remove_chat(self, chat_id: int | str):
-        chat = await self.app.get_chat(chat_id)
-        album = await self.vk_album.get_album_by_title(chat.title)
+        chat = await self.__get_chat(chat_id)
+        if str(chat.id) in self.albums_ids:
+            album = await self.vk_album.get_album_by_id(self.albums_ids[str(chat.id)])
+        else:
+            album = await self.vk_album.get_album_by_title(chat.title, chat.id)
         if album:
             await self.vk_album.remove_album(album["id"])
+            self.photo_index.remove_album(album["id"])
         self.chats.pop(chat.id)
-        self.__save_active_chats(list(self.chats.keys()))
+        self.state.remove_active(chat.id)
 
         self.albums_ids.pop(str(chat.id))
-        self.__save_albums_ids()
+        self.state.remove_album_id(str(chat.id))
+        for job_id, job in self.state.get_backfills().items():
+            if job["chat_id"] == chat.id:
+                self.state.remove_backfill(job_id)
 
-        posted = self.__get_posted()
-        posted.pop(str(chat.id))
-        self.__save_posted(posted)
+        self.state.remove_cursor(str(chat.id))
+        self.state.remove_chat_meta(chat.id)
+        self.journal.remove_chat(chat.id)
 
     async def _start_reposting(self):
         logging.info(msg=f"Reposting was started")
+        if "photos" in os.listdir() and not self.leases.enabled:
+            rmtree("photos")
+        self.pipeline.start(self.__upload_photos)
+        if self.leases.is_coordinator:
+            self.state.set_meta("is_started", "1")
+            self.state.set_meta("interval", str(self.interval))
+        if self.leases.enabled:
+            self.__renew_leases()
+            self.leases_task = asyncio.create_task(self.__run_leases())
+        self.backfill_task = asyncio.create_task(self.__run_backfill())
 
         while self.is_started:
             await self.__repost_to_album()
-            await asyncio.sleep(self.interval)
-
+            self.cycle_wakeup.clear()
+            sleep = self.scheduler.get_sleep(self.__get_owned_chats())
+            try:
+                await asyncio.wait_for(self.cycle_wakeup.wait(), sleep)
+            except asyncio.TimeoutError:
+                pass
+
+        self.stream.cancel()
+        self.backfill_task.cancel()
+        await asyncio.gather(self.backfill_task, return_exceptions=True)
+        await self.pipeline.stop()
+        if self.leases_task is not None:
+            self.leases_task.cancel()
+            await asyncio.gather(self.leases_task, return_exceptions=True)
+            self.leases_task = None
+        self.leases.release()
+        self.preprocessor.close()
         logging.info(msg=f"Reposting was stopped")
 
+    def __get_owned_chats(self) -> list[int]:
+        return self.leases.get_owned(list(self.chats))
+
+    def __load_albums_owners(self):
+        for chat_id, owner_id in self.state.get_albums_owners().items():
+            if chat_id in self.albums_ids:
+                self.vk_album.set_album_owner(self.albums_ids[chat_id], owner_id)
+
+    def __sync_chats(self):
+        self.chats_ids = self.state.get_active()
+        self.chats = {chat_id: self.chats.get(chat_id) for chat_id in self.chats_ids}
+        self.albums_ids = self.state.get_albums_ids()
+        self.__load_albums_owners()
+
+    def __sync_settings(self):
+        is_paused = self.state.get_meta("is_started") == "0"
+        if is_paused != self.is_paused:
+            logging.info(msg=f"Reposting was {'paused' if is_paused else 'resumed'}")
+            self.is_paused = is_paused
+        interval = self.state.get_meta("interval")
+        if interval is not None and int(interval) != self.interval:
+            self.scheduler.reset(int(interval))
+            self.interval = int(self.scheduler.interval)
+            self.cycle_wakeup.set()
+            logging.info(msg=f"Interval was changed to {self.interval} seconds")
+
+    def __renew_leases(self):
+        if not self.leases.is_coordinator:
+            self.__sync_chats()
+            self.__sync_settings()
+        busy = {chat_id for chat_id, _ in self.in_flight}
+        busy.update(
+            int(chat_id) for chat_id, lock in self.chat_locks.items() if lock.locked()
+        )
+        owned = set(self.__get_owned_chats())
+        self.leases.renew([] if self.is_paused else list(self.chats), busy)
+        if set(self.__get_owned_chats()) - owned:
+            self.cycle_wakeup.set()
+
+    async def __run_leases(self):
+        while True:
+            await asyncio.sleep(self.leases.renew_interval)
+            try:
+                self.__renew_leases()
+            except sqlite3.Error as err:
+                logging.error(msg=f"Failed to renew chat leases: {err}")
+
     async def __repost_to_album(self):
+        self.live_idle.clear()
+        try:
+            with CYCLE_SECONDS.time(), self.profiler.profile("repost_to_album", True):
+                await self.__repost_cycle()
+        finally:
+            self.live_idle.set()
+        CHAT_BACKLOG.clear()
+        for chat_id, backlog in self.journal.get_backlog().items():
+            CHAT_BACKLOG.set(backlog, chat=chat_id)
+
+    async def __repost_cycle(self):
         logging.info("Started reposting")
-        if "photos" in os.listdir():
-            rmtree("photos")
-        posted = self.__get_posted()
-        for chat_id in self.chats:
-            chat_id = str(chat_id)
-            logging.debug(f"Uploading {chat_id}...")
-            if chat_id not in posted:
-                posted.setdefault(chat_id, [])
-
-            if not posted[chat_id]:
-                limit = 20
-            else:
-                limit = abs(
-                    [mes async for mes in self.app.get_chat_history(chat_id, 1)][0].id
-                    - max(posted[chat_id])
+        await self.__resume_unsaved()
+        chats_ids = self.scheduler.get_due(self.__get_owned_chats())
+        self.top_messages_ids = await self.__get_top_messages_ids(chats_ids)
+        await self.pipeline.run(chats_ids, self.__download_chat)
+        if self.preprocessor.enabled:
+            stats = self.preprocessor.get_stats()
+            logging.info(
+                msg=f"Preprocessed {stats['processed']} photos, saved {stats['bytes_saved']} bytes in {stats['cpu_seconds']:.1f}s CPU"
+            )
+        logging.info(msg="Finished reposting")
+
+    async def __stream_handler(self, client: Client, msg: Message):
+        if not self.is_started or not self.pipeline.is_running:
+            return
+        self.stream.push(MessageRecord(msg), self.__flush_stream)
+
+    async def __flush_stream(self, chat_id: int, messages: list[MessageRecord]):
+        if not self.pipeline.is_running:
+            return
+        chat_id = str(chat_id)
+        async with self.__get_chat_lock(chat_id):
+            if not self.leases.is_owned(int(chat_id)):
+                return
+            last_id = self.state.get_cursor(chat_id)
+            if last_id is not None:
+                messages = [mes for mes in messages if mes.id > last_id]
+            if not messages:
+                return
+            if last_id is None or (
+                self.__has_sequential_ids(chat_id) and messages[-1].id != last_id + 1
+            ):
+                logging.info(msg=f"Found gap before new messages in {chat_id}")
+                await self.__download_chat_history(chat_id, self.pipeline.put)
+                return
+            if CaptionResolver(messages).needs_context():
+                logging.info(
+                    msg=f"Not found captions in new messages of {chat_id}, waiting for context"
                 )
-                # print([mes async for mes in self.app.get_chat_history(chat_id, 1)][0].id, '-', max(posted[chat_id]), '=', limit)
-                if limit == 0:
+                self.stream.defer(int(chat_id), CAPTION_ERROR, self.__flush_context)
+                return
+            album_id = self.albums_ids[chat_id]
+            await self.__get_photos_data(messages, album_id, self.pipeline.put)
+
+    async def __flush_context(self, chat_id: int):
+        if not self.pipeline.is_running:
+            return
+        chat_id = str(chat_id)
+        async with self.__get_chat_lock(chat_id):
+            if not self.leases.is_owned(int(chat_id)):
+                return
+            await self.__download_chat_history(
+                chat_id, self.pipeline.put, CONTEXT_MESSAGES
+            )
+
+    def __has_sequential_ids(self, chat_id: str) -> bool:
+        # basic groups share message ids with the whole account
+        chat = self.chats.get(int(chat_id))
+        if chat is not None:
+            chat_type = chat.type
+        else:
+            meta = self.state.get_chats_meta().get(int(chat_id))
+            if meta is None:
+                return True
+            chat_type = ChatType(meta["type"])
+        return chat_type in (ChatType.CHANNEL, ChatType.SUPERGROUP)
+
+    async def __get_top_messages_ids(self, chats_ids: list[int]):
+        tracked = set(chats_ids)
+        top_ids = {}
+        if not tracked:
+            return top_ids
+        try:
+            async for dialog in self.calls.iterate(HISTORY, self.app.get_dialogs):
+                if dialog.chat.id in tracked and dialog.top_message:
+                    top_ids[dialog.chat.id] = dialog.top_message.id
+                    if len(top_ids) == len(tracked):
+                        break
+        except exceptions.RPCError as err:
+            logging.error(msg=f"Failed to get dialogs:{err}")
+        return top_ids
+
+    def __get_chat_lock(self, chat_id: str):
+        return self.chat_locks.setdefault(chat_id, asyncio.Lock())
+
+    async def __download_chat(self, chat_id: int | str, put):
+        chat_id = str(chat_id)
+        try:
+            async with self.__get_chat_lock(chat_id):
+                if not self.leases.is_owned(int(chat_id)):
+                    logging.info(msg=f"{chat_id} was handed over to another worker")
+                    return
+                top_id = self.top_messages_ids.get(int(chat_id))
+                cursor = self.state.get_cursor(chat_id)
+                if top_id is not None and cursor is not None and top_id <= cursor:
                     logging.info(msg=f"No new messages in {chat_id}")
-                    continue
-                logging.info(msg=f"Found {limit} messages in {chat_id}")
-            messages: list[Message] = [
+                    found = 0
+                else:
+                    found = await self.__download_chat_history(chat_id, put)
+        except Exception:
+            self.scheduler.on_failure(int(chat_id))
+            raise
+        self.scheduler.on_success(int(chat_id), found)
+
+    async def __download_chat_history(self, chat_id: str, put, context_size: int = 0):
+        logging.debug(f"Downloading {chat_id}...")
+        cursor = self.state.get_cursor(chat_id)
+        context = []
+
+        with TG_REQUEST_SECONDS.time(method="get_chat_history"):
+            if cursor is None:
+                history = self.__get_history(chat_id, self.limit)
+                messages = [MessageRecord(mes) async for mes in history]
+            else:
+                messages = []
+                async for mes in self.__get_history(chat_id):
+                    if mes.id <= cursor:
+                        if len(context) == context_size:
+                            break
+                        context.append(MessageRecord(mes))
+                        continue
+                    if len(messages) == self.backfill_page_size:
+                        logging.info(
+                            msg=f"More than {self.backfill_page_size} new messages in {chat_id}, backfilling the rest"
+                        )
+                        self.__add_backfill(
+                            int(chat_id), offset_id=messages[-1].id, min_id=cursor
+                        )
+                        break
+                    messages.append(MessageRecord(mes))
+        if not messages:
+            logging.info(msg=f"No new messages in {chat_id}")
+            return 0
+        found = len(messages)
+        logging.info(msg=f"Found {found} messages in {chat_id}")
+        album_id = self.albums_ids[chat_id]
+        if context:
+            await self.__get_photos_data(messages + context, album_id, put, cursor)
+        else:
+            messages = await self.__refill_messages(messages)
+            await self.__get_photos_data(messages, album_id, put)
+        logging.info(f"Downloaded {chat_id}")
+        return found
+
+    def __add_backfill(
+        self,
+        chat_id: int,
+        offset_id: int = 0,
+        min_id: int = 0,
+        min_date: int = 0,
+        remaining: int | None = None,
+    ):
+        job = {
+            "chat_id": chat_id,
+            "offset_id": offset_id,
+            "min_id": min_id,
+            "min_date": min_date,
+            "remaining": remaining,
+        }
+        self.state.add_backfill(job)
+        self.backfill_wakeup.set()
+
+    async def __run_backfill(self):
+        while True:
+            if not await self.__backfill_round():
+                self.backfill_wakeup.clear()
+                timeout = self.leases.renew_interval if self.leases.enabled else None
+                try:
+                    await asyncio.wait_for(self.backfill_wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def __backfill_round(self) -> bool:
+        jobs = {
+            job_id: job
+            for job_id, job in self.state.get_backfills().items()
+            if self.leases.is_owned(job["chat_id"])
+            and str(job["chat_id"]) in self.albums_ids
+        }
+        for job_id, job in jobs.items():
+            await self.live_idle.wait()
+            try:
+                await self.__backfill_page(job_id, job)
+            except flood_420.FloodWait:
+                pass
+            except Exception as err:
+                logging.error(
+                    msg=f"Failed to backfill {job['chat_id']}:{err.__class__.__name__}:{err}"
+                )
+                await asyncio.sleep(self.scheduler.failure_backoff)
+        return bool(jobs)
+
+    async def __backfill_page(self, job_id: int, job: dict):
+        chat_id = str(job["chat_id"])
+        async with self.__get_chat_lock(chat_id):
+            if not self.leases.is_owned(job["chat_id"]):
+                return
+            with TG_REQUEST_SECONDS.time(method="get_chat_history"):
+                history = self.__get_history(
+                    chat_id, self.backfill_page_size, job["offset_id"]
+                )
+                page = [MessageRecord(mes) async for mes in history]
+            messages = [
                 mes
-                async for mes in self.app.get_chat_history(chat_id, limit)
-                if mes.id not in posted[str(chat_id)]
+                for mes in page
+                if mes.id > job["min_id"] and mes.date >= job["min_date"]
             ]
-            album_id = self.albums_ids[chat_id]
-            if not messages:
-                logging.info(f"No photos to upload from {chat_id}")
-                continue
-            messages = await self.__refill_messages(messages)
-            photos_data = await self.__get_photos_data(messages)
-            await self.vk_album.upload_photos_pack(album_id, photos_data)
-            photos_data.clear()
-            del photos_data
-            logging.info(f"Uploaded {chat_id}")
-        posted.clear()
-        del posted
-        logging.info(msg="Finished reposting")
+            if job["remaining"] is not None:
+                messages = messages[: job["remaining"]]
+                job["remaining"] -= len(messages)
+            if messages:
+                album_id = self.albums_ids[chat_id]
+                await self.__get_photos_data(
+                    messages, album_id, self.pipeline.put_backfill
+                )
+
+        is_done = (
+            len(page) < self.backfill_page_size
+            or len(messages) < len(page)
+            or job["remaining"] == 0
+        )
+        if is_done:
+            self.state.remove_backfill(job_id)
+            logging.info(msg=f"Finished backfill of {chat_id}")
+            return
+        job["offset_id"] = page[-1].id
+        self.state.set_backfill(job_id, job)
+        logging.info(msg=f"Backfilled {chat_id} down to {job['offset_id']}")
+
+    async def __upload_photos(
+        self,
+        album_id: int,
+        photos_data: list[tuple[BytesIO | str, str]],
+        keys: list[tuple[int, int]],
+        trying: int = 0,
+    ):
+        keys_by_photo = {id(data): key for data, key in zip(photos_data, keys)}
+
+        def set_state(batch: list[tuple[BytesIO | str, str]], state: str):
+            self.journal.set_state([keys_by_photo[id(data)] for data in batch], state)
+
+        def on_uploaded(batch: list[tuple[BytesIO | str, str]]):
+            set_state(batch, UPLOADED)
+            UPLOADED_BYTES.inc(
+                sum(self.storage.get_size(source) for source, _ in batch)
+            )
+
+        def on_saved(batch: list[tuple[BytesIO | str, str]], saved: list[dict]):
+            set_state(batch, SAVED)
+            for data, photo in zip(batch, saved):
+                hashes = self.photo_hashes.get(keys_by_photo[id(data)])
+                if hashes is not None:
+                    self.photo_index.add(*hashes, photo, album_id, data[1])
 
-    async def __refill_messages(self, messages: list[Message]):
         try:
-            mg = await self.app.get_media_group(messages[-1].chat.id, messages[-1].id)
+            left, retry_after = await self.vk_album.upload_photos_once(
+                album_id,
+                photos_data,
+                on_uploaded=on_uploaded,
+                on_saved=on_saved,
+            )
+        except Exception as err:
+            logging.error(msg=f"Failed to upload to {album_id}:{err}")
+            left, retry_after = photos_data, self.vk_album.PACK_FAIL_RETRY
+        uploaded = len(photos_data) - len(left)
+        logging.info(f"Uploaded {uploaded}/{len(photos_data)} photos to {album_id}")
+
+        trying += 1
+        # every pipeline try is a single attempt per batch, so the budget covers
+        # both the per-batch and the per-pack retries of a blocking upload
+        max_tries = (self.vk_album.PHOTO_UPLOAD_MT + 1) * self.vk_album.PACK_UPLOAD_MT
+        if left and trying < max_tries:
+            left_ids = {id(data) for data in left}
+            for data, key in zip(photos_data, keys):
+                if id(data) not in left_ids:
+                    self.storage.release(data[0])
+                    self.in_flight.discard(key)
+                    self.photo_hashes.pop(key, None)
+            left_keys = [keys_by_photo[id(data)] for data in left]
+            return retry_after, (album_id, left, left_keys, trying)
+
+        if left:
+            logging.info(
+                f"Skipping uploading {len(left)} photos to {album_id}: out of tries"
+            )
+        for source, _ in photos_data:
+            self.storage.release(source)
+        for key in keys:
+            self.in_flight.discard(key)
+            self.photo_hashes.pop(key, None)
+        photos_data.clear()
+
+    async def __refill_messages(self, messages: list[MessageRecord]):
+        try:
+            mg = await self.calls.call(
+                HISTORY, self.app.get_media_group, messages[-1].chat_id, messages[-1].id
+            )
             dif = messages[-1].id - mg[0].id
             if dif != 0:
                 messages.extend(
                     [
-                        mes
-                        async for mes in self.app.get_chat_history(
-                            messages[0].chat.id, dif, len(messages)
+                        MessageRecord(mes)
+                        async for mes in self.__get_history(
+                            messages[-1].chat_id, dif, messages[-1].id
                         )
                     ]
                 )
@@ -398,212 +905,256 @@ class UserBot:
             pass
         return messages
 
-    async def __get_photos_data(self, messages: list[Message]):
-        data = []
-        last_mes_id = messages[0].id
-        for ind, mes in enumerate(messages):
-            if mes.photo:
-                caption = await self.__get_photo_caption(ind, messages)
-                path_to_photo = await self.app.download_media(
-                    mes, f"photos/{mes.chat.id}/{mes.id}.jpeg"
-                )
-                data.append((path_to_photo, caption))
-        posted = self.__get_posted()
-        if len(posted[str(mes.chat.id)]) > 5:
-            posted[str(mes.chat.id)] = [last_mes_id]
-            logging.info(f"Cleared posted[{mes.chat.id}]")
-        else:
-            posted[str(mes.chat.id)].append(last_mes_id)
-        self.__save_posted(posted)
-        del posted
-        try:
-            del caption
-        except UnboundLocalError:
-            pass
-        try:
-            del path_to_photo
-        except UnboundLocalError:
-            pass
-        return data
-
-    async def __get_photo_caption(self, ind: int, messages: list[Message]):
-        mes = messages[ind]
-        caption = await self.__get_caption(None, messages, ind)
-        if caption is None:
-            msg = f"Not found caption for {mes.id}"
-            caption = ""
-        else:
-            msg = f"Found caption for {mes.id}"
-        logging.debug(msg=msg)
-        del msg
-        return caption
+    async def __get_photos_data(
+        self, messages: list[MessageRecord], album_id: int, put, min_id: int = 0
+    ):
+        with self.profiler.profile("get_photos_data"):
+            await self.__collect_photos_data(messages, album_id, put, min_id)
 
-    async def __get_caption(
-        self,
-        mes: Message | None = None,
-        messages: list[Message] | None = None,
-        ind: int | None = None,
-        try_num: int = 1,
+    async def __collect_photos_data(
+        self, messages: list[MessageRecord], album_id: int, put, min_id: int = 0
     ):
-        if try_num >= 40:
-            return
-        if mes is None and (messages is None or ind is None):
-            raise ValueError("mes or messages and ind must be filled")
-        if mes is None:
-            mes = messages[ind]
-        logging.debug(f"Try {try_num} to get caption for {mes.id} ({mes.chat.id})...")
+        chat_id = messages[0].chat_id
+        last_mes_id = messages[0].id
+        resolver = CaptionResolver(messages)
+        await resolver.fetch_boundary_groups(
+            partial(self.calls.call, HISTORY, self.app.get_media_group)
+        )
+        entries = []
+        for ind, mes in enumerate(messages):
+            if mes.file_id and mes.id > min_id:
+                caption = resolver.resolve(ind)
+                if caption is None:
+                    logging.debug(msg=f"Not found caption for {mes.id}")
+                    caption = ""
+                entries.append((mes, caption))
+        del resolver
+        saved = self.journal.get_saved(chat_id, [mes.id for mes, _ in entries])
+        entries = [(mes, caption) for mes, caption in entries if mes.id not in saved]
+        self.journal.add(
+            chat_id, album_id, [(mes.id, caption) for mes, caption in entries]
+        )
 
-        if mes.text:
-            return mes.text
-        if mes.caption:
-            return mes.caption
+        cursor = self.state.get_cursor(str(chat_id))
+        if cursor is None or last_mes_id > cursor:
+            self.state.set_cursor(str(chat_id), last_mes_id)
 
-        try:
-            media_group = await self.app.get_media_group(mes.chat.id, mes.id)
-            for mes in media_group:
-                if mes.caption:
-                    return mes.caption
-        except ValueError:  # не нашлось подписи и медиагруппы у данного сообщения
-            media_group = None
-
-        if messages is None and ind is None:
-            raise ValueError("caption was not found. messages and ind must be filled")
-
-        ind = await self.__method_wrapper(
-            self.__get_new_message_ind,
-            True,
-            messages=messages,
-            ind=ind,
-            media_group=media_group,
-        )
-        if ind is None:
-            ind = 0
-        return await self.__get_caption(None, messages, ind, try_num + 1)
+        await self.__download_photos(chat_id, album_id, entries, put)
 
-    async def __get_new_message_ind(
+    async def __download_photos(
         self,
-        messages: list[Message],
-        ind: int,
-        ids_and_chats: list[tuple[int, int]] | None = None,
-        media_group: list[Message] | None = None,
+        chat_id: int,
+        album_id: int,
+        entries: list[tuple[MessageRecord, str]],
+        put,
     ):
-        if media_group is None:
-            next_mes_ind = ind - 1
-            prev_mes_ind = ind + 1
-        else:
-            if not ids_and_chats:
-                ids_and_chats = [(mes.id, mes.chat.id) for mes in messages]
-            next_mes_ind = (
-                ids_and_chats.index((media_group[-1].id, media_group[-1].chat.id)) - 1
-            )
-            prev_mes_ind = (
-                ids_and_chats.index((media_group[0].id, media_group[0].chat.id)) + 1
+        queue = deque(
+            (mes, caption)
+            for mes, caption in entries
+            if (chat_id, mes.id) not in self.in_flight
+        )
+        self.in_flight.update((chat_id, mes.id) for mes, _ in queue)
+        downloads: deque[tuple[MessageRecord, str, asyncio.Task]] = deque()
+        data, keys = [], []
+        current, source = None, None
+        try:
+            while queue or downloads:
+                while queue and len(downloads) < self.download_concurrency:
+                    mes, caption = queue.popleft()
+                    task = asyncio.create_task(self.__download_photo(mes))
+                    downloads.append((mes, caption, task))
+
+                mes, caption, task = downloads.popleft()
+                key = current = (chat_id, mes.id)
+                source = await task
+                PHOTOS_DOWNLOADED.inc(chat=chat_id)
+                size = self.storage.get_size(source)
+                DOWNLOADED_BYTES.inc(size)
+                self.journal.set_state([key], DOWNLOADED)
+                if self.photo_index.enabled and await self.__reuse_photo(
+                    album_id, key, source, caption
+                ):
+                    current, source = None, None
+                    continue
+                if self.preprocessor.enabled:
+                    await self.preprocessor.process(source, size)
+                data.append((source, caption))
+                keys.append(key)
+                current, source = None, None
+                if len(data) >= UPLOAD_BATCH_SIZE:
+                    await put(album_id, data, keys)
+                    data, keys = [], []
+            if data:
+                await put(album_id, data, keys)
+                data, keys = [], []
+        finally:
+            if current is not None:
+                self.storage.release(source)
+                self.in_flight.discard(current)
+            for mes, _, task in downloads:
+                task.cancel()
+            for mes, _, task in downloads:
+                try:
+                    self.storage.release(await task)
+                except BaseException:
+                    pass
+            for source, _ in data:
+                self.storage.release(source)
+            self.in_flight.difference_update(
+                [(chat_id, mes.id) for mes, *_ in (*queue, *downloads)] + keys
             )
 
-        next_mes = messages[next_mes_ind]
-        if prev_mes_ind != len(messages):
-            prev_mes = messages[prev_mes_ind]
-            mes = messages[ind]
-            dif_prev = abs(mes.date - prev_mes.date)
-            dif_next = abs(mes.date - next_mes.date)
-        try:
-            # print(f"{prev_mes_ind >= len(messages)} or (({timedelta(0, 0, 0, 0, 1) > dif_next} or {dif_next < dif_prev}) and {next_mes_ind >= 0})")
-            is_fits_err = (
-                timedelta(0, 0, 0, 0, 2) > dif_next or dif_next < dif_prev
-            )  # подходит под погрешность
-            is_fits_video_err = (
-                next_mes.media == MessageMediaType.VIDEO
-                and timedelta(0, 30, 0, 0, 7) > dif_next
-            )  # подходит под погрешность видео
-        except UnboundLocalError:
-            # print(f"{prev_mes_ind >= len(messages)} or (None and {next_mes_ind >= 0})")
-            is_fits_err, is_fits_video_err = False, False
-
-        if prev_mes_ind >= len(messages) or (
-            (is_fits_err or is_fits_video_err) and next_mes_ind >= 0
-        ):  # берем подпись в качестве след. сообщения
-            return next_mes_ind
-        else:  # берем подпись в качестве пред. сообщения
-            return prev_mes_ind
+    async def __download_photo(self, mes: MessageRecord) -> BytesIO | str:
+        return await self.calls.call(DOWNLOAD, self.storage.download, self.app, mes)
 
-    async def __get_chats(self):
-        chats = {}
-        for chat_id in self.chats_ids:
+    async def __reuse_photo(
+        self,
+        album_id: int,
+        key: tuple[int, int],
+        source: BytesIO | str,
+        caption: str,
+    ) -> bool:
+        hashes = await self.photo_index.hash(source)
+        photo = self.photo_index.get(
+            *hashes, self.vk_album.get_owner_id(album_id), album_id
+        )
+        if photo is not None and photo["album_id"] != album_id:
+            copy = await self.vk_album.copy_photo(photo, album_id, caption)
+            if copy is None:
+                self.photo_index.remove(photo["hash"], photo["album_id"])
+                photo = None
+            else:
+                self.photo_index.add(*hashes, copy, album_id, caption)
+                logging.info(msg=f"Copied duplicate of {key} to {album_id}")
+                PHOTOS_DEDUPLICATED.inc(action="copied")
+        elif photo is not None:
+            logging.info(msg=f"Skipping duplicate of {key} in {album_id}")
+            PHOTOS_DEDUPLICATED.inc(action="skipped")
+
+        if photo is None:
+            self.photo_hashes[key] = hashes
+            return False
+        self.journal.set_state([key], SAVED)
+        self.storage.release(source)
+        self.in_flight.discard(key)
+        return True
+
+    async def __resume_unsaved(self):
+        for chat_id, entries in self.journal.get_unsaved().items():
+            if not self.leases.is_owned(chat_id):
+                continue
+            if str(chat_id) not in self.albums_ids:
+                self.journal.remove_chat(chat_id)
+                continue
+            entries = [
+                entry for entry in entries if (chat_id, entry[0]) not in self.in_flight
+            ]
+            if not entries:
+                continue
+            logging.info(msg=f"Resuming {len(entries)} unsaved photos from {chat_id}")
             try:
-                chats.setdefault(chat_id, await self.app.get_chat(chat_id))
-            except (
-                bad_request_400.ChannelInvalid,
-                bad_request_400.ChatInvalid,
-                bad_request_400.ChatIdInvalid,
-                bad_request_400.PeerIdInvalid,
+                await self.__resume_chat(chat_id, entries)
+            except Exception as err:
+                logging.error(
+                    msg=f"Failed to resume {chat_id}:{err.__class__.__name__}:{err}"
+                )
+                self.scheduler.on_failure(chat_id)
+
+    async def __resume_chat(self, chat_id: int, entries: list[tuple]):
+        found = {}
+        for i in range(0, len(entries), 200):
+            messages_ids = [message_id for message_id, *_ in entries[i : i + 200]]
+            for mes in await self.calls.call(
+                HISTORY, self.app.get_messages, chat_id, messages_ids
             ):
-                logging.warning(msg=f"User did not subscribed on {chat_id}")
-        return chats
+                if not mes.empty and mes.photo:
+                    found[mes.id] = MessageRecord(mes)
+        self.journal.discard(
+            [
+                (chat_id, message_id)
+                for message_id, _, _ in entries
+                if message_id not in found
+            ]
+        )
+
+        album_id = self.albums_ids[str(chat_id)]
+        entries = [
+            (found[message_id], caption)
+            for message_id, _, caption in entries
+            if message_id in found
+        ]
+        async with self.__get_chat_lock(str(chat_id)):
+            if not self.leases.is_owned(chat_id):
+                return
+            await self.__download_photos(chat_id, album_id, entries, self.pipeline.put)
+
+    async def __get_chats(self):
+        cached = self.state.get_chats_meta()
+        chats = {
+            chat_id: self.__chat_from_meta(chat_id, cached[chat_id])
+            for chat_id in self.chats_ids
+            if chat_id in cached
+        }
+        missing = [chat_id for chat_id in self.chats_ids if chat_id not in cached]
+        if missing:
+            logging.info(msg=f"Resolving {len(missing)} chats...")
+        resolved = await asyncio.gather(
+            *[self.__resolve_chat(chat_id) for chat_id in missing]
+        )
+        for chat_id, chat in zip(missing, resolved):
+            if chat is not None:
+                chats[chat_id] = chat
+        return {
+            chat_id: chats[chat_id] for chat_id in self.chats_ids if chat_id in chats
+        }
 
-    async def __method_wrapper(self, func, is_async: bool, try_num: int = 1, **kwargs):
+    async def __resolve_chat(self, chat_id: int | str):
         try:
-            return await func(**kwargs) if is_async else func(**kwargs)
-        except BaseException as e:
-            logging.error(msg=f"Try {try_num}:{e.__class__.__name__}:{e.__str__()}")
-            retry_seconds = (
-                self.retry_seconds if e.__class__ not in [IndexError, ValueError] else 1
-            )
-            if e.__class__ is ValueError:
-                messages = kwargs["messages"]
-                ids_and_chats = [(mes.id, mes.chat.id) for mes in messages]
-                kwargs.setdefault("ids_and_chats", ids_and_chats)
-
-            if try_num < 5:
-                logging.info(msg=f"Retrying in {retry_seconds} seconds...")
-                await asyncio.sleep(retry_seconds)
-                return await self.__method_wrapper(
-                    func, is_async, try_num + 1, **kwargs
-                )
-            else:
-                args = ", ".join([k for k in kwargs.keys()])
-                logging.info(msg=f"Out of tries. Skipping {func.__name__}({args})")
+            return await self.__get_chat(chat_id)
+        except (
+            bad_request_400.ChannelInvalid,
+            bad_request_400.ChatInvalid,
+            bad_request_400.ChatIdInvalid,
+            bad_request_400.PeerIdInvalid,
+        ):
+            logging.warning(msg=f"User did not subscribed on {chat_id}")
+
+    async def __get_chat(self, chat_id: int | str) -> Chat:
+        chat = await self.calls.call(RESOLVE, self.app.get_chat, chat_id)
+        self.state.set_chat_meta(
+            chat.id,
+            {"title": chat.title, "username": chat.username, "type": chat.type.value},
+        )
+        return chat
+
+    def __chat_from_meta(self, chat_id: int, meta: dict):
+        return Chat(
+            id=chat_id,
+            type=ChatType(meta["type"]),
+            title=meta["title"],
+            username=meta["username"],
+        )
 
     async def __get_chat_id_by_title(self, title: str):
-        async for mes in self.app.search_global(title):
+        async for mes in self.calls.iterate(RESOLVE, self.app.search_global, title):
             if mes.chat.title == title:
                 return mes.chat.id
 
-    def __get_chats_data(self) -> dict[str, dict[int, int]]:
-        with open("telegram/chats_data.json") as f:
-            return json.load(f)
-
-    def __update_chats_data(self, value: dict):
-        with open("telegram/chats_data.json", "w") as f:
-            json.dump(value, f, indent=4)
-
-    def __save_posted(self, posted: dict[int, int]):
-        data = self.__get_chats_data()
-        data["posted"] = posted
-        self.__update_chats_data(data)
-
-    def __save_albums_ids(self):
-        data = self.__get_chats_data()
-        data["albums_ids"] = self.albums_ids
-        self.__update_chats_data(data)
-
-    def __save_active_chats(self, ids: list[int]):
-        data = self.__get_chats_data()
-        data["active"] = ids
-        self.__update_chats_data(data)
-
-    def __get_posted(self):
-        data = self.__get_chats_data()
-        saved_posted = data["posted"].items()
-        posted = {chat_id: value for chat_id, value in saved_posted}
-        data["posted"] = posted
-        return posted
-
-    def __get_albums_ids(self):
-        data = self.__get_chats_data()
-        saved_albums_ids = data["albums_ids"].items()
-        albums_ids = {chat_id: value for chat_id, value in saved_albums_ids}
-        data["albums_ids"] = albums_ids
-        return albums_ids
+    def __get_history(self, chat_id: int | str, limit: int = 0, offset_id: int = 0):
+        return self.calls.iterate(
+            HISTORY,
+            self.app.get_chat_history,
+            chat_id,
+            limit=limit,
+            offset_id=offset_id,
+            resume=lambda mes, count: {
+                "offset_id": mes.id,
+                "limit": limit - count if limit else 0,
+            },
+        )
+
+    async def __send_message(self, text: str):
+        await self.calls.call(MESSAGES, self.app.send_message, "me", text)
 
     def __get_handlers_funcs(self):
         return {
@@ -612,6 +1163,9 @@ class UserBot:
             "start": self.__start_handler,
             "stop": self.__stop_handler,
             "chats": self.__chats_handler,
+            "schedule": self.__schedule_handler,
+            "stats": self.__stats_handler,
+            "backfill": self.__backfill_handler,
             "add": self.__add_handler,
             "rem": self.__rem_handler,
         }
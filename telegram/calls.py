@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, Awaitable, Callable
+from pyrogram.errors import FloodWait
+from metrics import TG_FLOOD_WAIT_SECONDS, TG_FLOOD_WAITS, TG_REQUEST_SECONDS
+
+RESOLVE = "resolve"
+HISTORY = "history"
+DOWNLOAD = "download"
+MESSAGES = "messages"
+
+
+class TelegramCalls:
+    def __init__(
+        self,
+        resolve_concurrency: int,
+        history_concurrency: int,
+        download_concurrency: int,
+        max_wait: int,
+    ):
+        self.max_wait = max_wait
+        limits = {
+            RESOLVE: resolve_concurrency,
+            HISTORY: history_concurrency,
+            DOWNLOAD: download_concurrency,
+            MESSAGES: 1,
+        }
+        self.semaphores = {
+            kind: asyncio.Semaphore(limit) for kind, limit in limits.items()
+        }
+        self.paused_until = {kind: 0.0 for kind in limits}
+
+    async def __wait(self, kind: str):
+        delay = self.paused_until[kind] - time.monotonic()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self.paused_until[kind] - time.monotonic()
+
+    def __on_flood_wait(self, kind: str, method: str, err: FloodWait) -> bool:
+        TG_FLOOD_WAITS.inc(method=method)
+        TG_FLOOD_WAIT_SECONDS.inc(err.value)
+        self.paused_until[kind] = max(
+            self.paused_until[kind], time.monotonic() + err.value
+        )
+        logging.warning(
+            msg=f"FloodWait of {err.value} seconds on {method}. Pausing {kind} calls..."
+        )
+        return err.value <= self.max_wait
+
+    async def call(self, kind: str, func: Callable[..., Awaitable], *args, **kwargs):
+        method = func.__name__
+        while True:
+            await self.__wait(kind)
+            async with self.semaphores[kind]:
+                try:
+                    with TG_REQUEST_SECONDS.time(method=method):
+                        return await func(*args, **kwargs)
+                except FloodWait as err:
+                    if not self.__on_flood_wait(kind, method, err):
+                        raise
+
+    async def iterate(
+        self,
+        kind: str,
+        func: Callable[..., AsyncIterator],
+        *args,
+        resume: Callable[[object, int], dict] | None = None,
+        **kwargs,
+    ):
+        method = func.__name__
+        iterator = func(*args, **kwargs)
+        last, count, skip = None, 0, 0
+        while True:
+            await self.__wait(kind)
+            async with self.semaphores[kind]:
+                try:
+                    item = await anext(iterator)
+                except StopAsyncIteration:
+                    return
+                except FloodWait as err:
+                    if not self.__on_flood_wait(kind, method, err):
+                        raise
+                    if resume is not None and last is not None:
+                        iterator = func(*args, **{**kwargs, **resume(last, count)})
+                    else:
+                        iterator = func(*args, **kwargs)
+                        skip = count
+                    continue
+            if skip:
+                skip -= 1
+                continue
+            last, count = item, count + 1
+            yield item
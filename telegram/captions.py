@@ -0,0 +1,102 @@
+from datetime import timedelta
+from pyrogram.enums import MessageMediaType
+from .records import MessageRecord
+
+MAX_STEPS = 40
+CONTEXT_MESSAGES = 10
+CAPTION_ERROR = timedelta(minutes=2).total_seconds()
+VIDEO_CAPTION_ERROR = timedelta(minutes=7, seconds=30).total_seconds()
+
+
+class CaptionResolver:
+    def __init__(self, messages: list[MessageRecord]):
+        self.messages = messages
+        self.groups: dict[str, list[int]] = {}
+        for ind, mes in enumerate(messages):
+            if mes.media_group_id:
+                self.groups.setdefault(mes.media_group_id, []).append(ind)
+        self.groups_captions: dict[str, str | None] = {}
+        self.resolved: dict[int, str | None] = {}
+
+    async def fetch_boundary_groups(self, get_media_group):
+        edges = {0, len(self.messages) - 1}
+        for group_id, inds in self.groups.items():
+            if inds[0] not in edges and inds[-1] not in edges:
+                continue
+            mes = self.messages[inds[0]]
+            try:
+                media_group = await get_media_group(mes.chat_id, mes.id)
+            except ValueError:
+                continue
+            self.groups_captions[group_id] = next(
+                (mes.caption for mes in media_group if mes.caption), None
+            )
+
+    def needs_context(self) -> bool:
+        return any(
+            mes.file_id and self.resolve(ind) is None
+            for ind, mes in enumerate(self.messages)
+        )
+
+    def resolve(self, ind: int) -> str | None:
+        path = []
+        caption = None
+        cur = ind
+        for _ in range(MAX_STEPS):
+            if cur is None or cur in path:
+                break
+            if cur in self.resolved:
+                caption = self.resolved[cur]
+                break
+            path.append(cur)
+            caption = self.__get_own_caption(cur)
+            if caption:
+                break
+            cur = self.__get_next_ind(cur)
+        for visited in path:
+            self.resolved[visited] = caption
+        return caption
+
+    def __get_own_caption(self, ind: int):
+        mes = self.messages[ind]
+        if mes.text:
+            return mes.text
+        if mes.caption:
+            return mes.caption
+        if mes.media_group_id:
+            return self.__get_group_caption(mes.media_group_id)
+
+    def __get_group_caption(self, group_id: str):
+        if group_id not in self.groups_captions:
+            self.groups_captions[group_id] = next(
+                (
+                    self.messages[ind].caption
+                    for ind in self.groups[group_id]
+                    if self.messages[ind].caption
+                ),
+                None,
+            )
+        return self.groups_captions[group_id]
+
+    def __get_next_ind(self, ind: int) -> int | None:
+        mes = self.messages[ind]
+        if mes.media_group_id:
+            inds = self.groups[mes.media_group_id]
+            next_mes_ind, prev_mes_ind = inds[0] - 1, inds[-1] + 1
+        else:
+            next_mes_ind, prev_mes_ind = ind - 1, ind + 1
+
+        if next_mes_ind < 0:
+            return prev_mes_ind if prev_mes_ind < len(self.messages) else None
+        if prev_mes_ind >= len(self.messages):
+            return next_mes_ind
+
+        date = self.messages[ind].date
+        dif_next = abs(date - self.messages[next_mes_ind].date)
+        dif_prev = abs(date - self.messages[prev_mes_ind].date)
+        is_fits_err = CAPTION_ERROR > dif_next or dif_next < dif_prev
+        is_fits_video_err = (
+            self.messages[next_mes_ind].media == MessageMediaType.VIDEO
+            and VIDEO_CAPTION_ERROR > dif_next
+        )
+        return next_mes_ind if is_fits_err or is_fits_video_err else prev_mes_ind
@@ -0,0 +1,118 @@
+import asyncio
+import hashlib
+import sqlite3
+from io import BytesIO
+from PIL import Image
+
+PHASH_SIZE = 8
+
+
+def get_hashes(source: BytesIO | str, perceptual: bool) -> tuple[str, str | None]:
+    if isinstance(source, BytesIO):
+        content = source.getvalue()
+    else:
+        with open(source, "rb") as f:
+            content = f.read()
+    digest = hashlib.sha256(content).hexdigest()
+    if not perceptual:
+        return digest, None
+
+    try:
+        with Image.open(BytesIO(content)) as image:
+            pixels = list(
+                image.convert("L").resize((PHASH_SIZE + 1, PHASH_SIZE)).getdata()
+            )
+    except OSError:
+        return digest, None
+    bits = 0
+    for row in range(PHASH_SIZE):
+        for col in range(PHASH_SIZE):
+            ind = row * (PHASH_SIZE + 1) + col
+            bits = bits << 1 | (pixels[ind] > pixels[ind + 1])
+    return digest, f"{bits:016x}"
+
+
+class PhotoIndex:
+    def __init__(self, enabled: bool, path: str, perceptual: bool):
+        self.enabled = enabled
+        self.perceptual = perceptual
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS placements (
+                    hash TEXT NOT NULL,
+                    phash TEXT,
+                    owner_id INTEGER NOT NULL,
+                    photo_id INTEGER NOT NULL,
+                    album_id INTEGER NOT NULL,
+                    caption TEXT NOT NULL,
+                    PRIMARY KEY (hash, album_id)
+                );
+                CREATE INDEX IF NOT EXISTS placements_phash ON placements (phash);
+                """
+            )
+            tables = self.conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'photos'"
+            )
+            if tables.fetchone() is not None:
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO placements SELECT * FROM photos"
+                )
+                self.conn.execute("DROP TABLE photos")
+
+    async def hash(self, source: BytesIO | str) -> tuple[str, str | None]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, get_hashes, source, self.perceptual)
+
+    def get(
+        self, digest: str, phash: str | None, owner_id: int, album_id: int
+    ) -> dict | None:
+        query = (
+            "SELECT hash, owner_id, photo_id, album_id, caption FROM placements "
+            "WHERE {} = ? AND owner_id = ? ORDER BY album_id = ? DESC LIMIT 1"
+        )
+        row = self.conn.execute(
+            query.format("hash"), (digest, owner_id, album_id)
+        ).fetchone()
+        if row is None and phash is not None:
+            row = self.conn.execute(
+                query.format("phash"), (phash, owner_id, album_id)
+            ).fetchone()
+        if row is None:
+            return
+        digest, owner_id, photo_id, album_id, caption = row
+        return {
+            "hash": digest,
+            "owner_id": owner_id,
+            "photo_id": photo_id,
+            "album_id": album_id,
+            "caption": caption,
+        }
+
+    def add(
+        self,
+        digest: str,
+        phash: str | None,
+        photo: dict,
+        album_id: int,
+        caption: str,
+    ):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO placements VALUES (?, ?, ?, ?, ?, ?)",
+                (digest, phash, photo["owner_id"], photo["id"], album_id, caption),
+            )
+
+    def remove(self, digest: str, album_id: int):
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM placements WHERE hash = ? AND album_id = ?",
+                (digest, album_id),
+            )
+
+    def remove_album(self, album_id: int):
+        with self.conn:
+            self.conn.execute("DELETE FROM placements WHERE album_id = ?", (album_id,))
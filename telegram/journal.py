@@ -0,0 +1,88 @@
+import sqlite3
+import time
+
+PENDING = "pending"
+DOWNLOADED = "downloaded"
+UPLOADED = "uploaded"
+SAVED = "saved"
+
+
+class UploadJournal:
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS journal (
+                    chat_id INTEGER NOT NULL,
+                    message_id INTEGER NOT NULL,
+                    album_id INTEGER NOT NULL,
+                    caption TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (chat_id, message_id)
+                );
+                CREATE INDEX IF NOT EXISTS journal_state ON journal (state);
+                """
+            )
+
+    def add(self, chat_id: int, album_id: int, entries: list[tuple[int, str]]):
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO journal VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (chat_id, message_id, album_id, caption, PENDING, now)
+                    for message_id, caption in entries
+                ],
+            )
+
+    def set_state(self, keys: list[tuple[int, int]], state: str):
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE journal SET state = ?, updated_at = ? "
+                "WHERE chat_id = ? AND message_id = ?",
+                [(state, now, chat_id, message_id) for chat_id, message_id in keys],
+            )
+
+    def discard(self, keys: list[tuple[int, int]]):
+        with self.conn:
+            self.conn.executemany(
+                "DELETE FROM journal WHERE chat_id = ? AND message_id = ?", keys
+            )
+
+    def get_saved(self, chat_id: int, messages_ids: list[int]) -> set[int]:
+        if not messages_ids:
+            return set()
+        placeholders = ", ".join("?" * len(messages_ids))
+        rows = self.conn.execute(
+            f"SELECT message_id FROM journal WHERE chat_id = ? AND state = ? "
+            f"AND message_id IN ({placeholders})",
+            (chat_id, SAVED, *messages_ids),
+        )
+        return {message_id for message_id, in rows}
+
+    def get_unsaved(self) -> dict[int, list[tuple[int, int, str]]]:
+        rows = self.conn.execute(
+            "SELECT chat_id, message_id, album_id, caption FROM journal "
+            "WHERE state != ? ORDER BY chat_id, message_id DESC",
+            (SAVED,),
+        )
+        unsaved = {}
+        for chat_id, message_id, album_id, caption in rows:
+            unsaved.setdefault(chat_id, []).append((message_id, album_id, caption))
+        return unsaved
+
+    def get_backlog(self) -> dict[int, int]:
+        rows = self.conn.execute(
+            "SELECT chat_id, COUNT(*) FROM journal WHERE state != ? GROUP BY chat_id",
+            (SAVED,),
+        )
+        return dict(rows.fetchall())
+
+    def remove_chat(self, chat_id: int):
+        with self.conn:
+            self.conn.execute("DELETE FROM journal WHERE chat_id = ?", (chat_id,))
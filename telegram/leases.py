@@ -0,0 +1,118 @@
+import hashlib
+import logging
+import sqlite3
+import time
+
+COORDINATOR_ID = "main"
+
+
+class ChatLeases:
+    def __init__(
+        self, enabled: bool, path: str, lease_seconds: int, worker_id: str | None
+    ):
+        self.enabled = enabled
+        self.worker_id = worker_id or COORDINATOR_ID
+        self.is_coordinator = worker_id is None
+        self.lease_seconds = lease_seconds
+        self.renew_interval = lease_seconds / 3
+        self.held: set[int] = set()
+        self.assigned: set[int] = set()
+        if not enabled:
+            return
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS workers (
+                    worker_id TEXT PRIMARY KEY,
+                    heartbeat REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS leases (
+                    chat_id INTEGER PRIMARY KEY,
+                    worker_id TEXT NOT NULL,
+                    expires REAL NOT NULL
+                );
+                """
+            )
+
+    def is_owned(self, chat_id: int) -> bool:
+        if not self.enabled:
+            return True
+        return chat_id in self.held and chat_id in self.assigned
+
+    def get_owned(self, chats_ids: list[int]) -> list[int]:
+        return [chat_id for chat_id in chats_ids if self.is_owned(chat_id)]
+
+    def __get_live_workers(self, now: float) -> list[str]:
+        rows = self.conn.execute(
+            "SELECT worker_id FROM workers WHERE heartbeat >= ?",
+            (now - self.lease_seconds,),
+        )
+        return [worker_id for worker_id, in rows]
+
+    @staticmethod
+    def __get_weight(chat_id: int, worker_id: str) -> int:
+        digest = hashlib.sha256(f"{chat_id}:{worker_id}".encode()).digest()
+        return int.from_bytes(digest[:8], "big")
+
+    def __get_assigned(self, chats_ids: list[int], workers: list[str]) -> set[int]:
+        return {
+            chat_id
+            for chat_id in chats_ids
+            if max(workers, key=lambda worker: self.__get_weight(chat_id, worker))
+            == self.worker_id
+        }
+
+    def renew(self, chats_ids: list[int], busy: set[int]):
+        if not self.enabled:
+            return
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO workers VALUES (?, ?)", (self.worker_id, now)
+            )
+        assigned = self.__get_assigned(chats_ids, self.__get_live_workers(now))
+        released = [
+            chat_id for chat_id in self.held - assigned if chat_id not in busy
+        ]
+        expires = now + self.lease_seconds
+        with self.conn:
+            self.conn.executemany(
+                "DELETE FROM leases WHERE chat_id = ? AND worker_id = ?",
+                [(chat_id, self.worker_id) for chat_id in released],
+            )
+            self.conn.executemany(
+                "INSERT INTO leases VALUES (?, ?, ?) "
+                "ON CONFLICT (chat_id) DO UPDATE SET "
+                "worker_id = excluded.worker_id, expires = excluded.expires "
+                "WHERE leases.worker_id = excluded.worker_id OR leases.expires < ?",
+                [
+                    (chat_id, self.worker_id, expires, now)
+                    for chat_id in assigned | (self.held - set(released))
+                ],
+            )
+        rows = self.conn.execute(
+            "SELECT chat_id FROM leases WHERE worker_id = ?", (self.worker_id,)
+        )
+        held = {chat_id for chat_id, in rows}
+        if held != self.held or assigned != self.assigned:
+            logging.info(
+                msg=f"Worker {self.worker_id} holds {len(held & assigned)} of {len(chats_ids)} chats"
+            )
+        self.held = held
+        self.assigned = assigned
+
+    def release(self):
+        if not self.enabled:
+            return
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM leases WHERE worker_id = ?", (self.worker_id,)
+            )
+            self.conn.execute(
+                "DELETE FROM workers WHERE worker_id = ?", (self.worker_id,)
+            )
+        self.held = set()
+        self.assigned = set()
@@ -0,0 +1,51 @@
+import logging
+import os
+from io import BytesIO
+from pyrogram import Client
+from .records import MessageRecord
+
+
+class PhotoStorage:
+    def __init__(self, in_memory: bool, memory_limit_mb: int):
+        self.in_memory = in_memory
+        self.memory_limit = memory_limit_mb * 1024 * 1024
+        self.memory_used = 0
+        self.reserved: dict[int, int] = {}
+
+    async def download(self, app: Client, mes: MessageRecord) -> BytesIO | str:
+        size = mes.file_size
+        if self.in_memory and self.memory_used + size <= self.memory_limit:
+            self.memory_used += size
+            try:
+                buffer = await app.download_media(mes.file_id, in_memory=True)
+            except BaseException:
+                self.memory_used -= size
+                raise
+            self.reserved[id(buffer)] = size
+            return buffer
+
+        if self.in_memory:
+            logging.debug(
+                msg=f"Memory limit reached ({self.memory_used} bytes), spooling {mes.id} to disk"
+            )
+        return await app.download_media(
+            mes.file_id, f"photos/{mes.chat_id}/{mes.id}.jpeg"
+        )
+
+    def get_size(self, source: BytesIO | str) -> int:
+        if isinstance(source, BytesIO):
+            return source.getbuffer().nbytes
+        return os.path.getsize(source)
+
+    def release(self, source: BytesIO | str | None):
+        if source is None:
+            return
+        if isinstance(source, BytesIO):
+            self.memory_used -= self.reserved.pop(id(source), 0)
+            source.close()
+            return
+        try:
+            os.remove(source)
+            os.rmdir(os.path.dirname(source))
+        except OSError:
+            pass
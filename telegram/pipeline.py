@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable
+from metrics import PIPELINE_PENDING
+
+
+class RepostPipeline:
+    def __init__(
+        self,
+        queue_size: int,
+        download_workers: int,
+        upload_workers: int,
+        backfill_queue_size: int,
+    ):
+        self.queue_size = queue_size
+        self.backfill_queue_size = max(1, min(backfill_queue_size, queue_size))
+        self.download_workers = download_workers
+        self.upload_workers = upload_workers
+        self.uploaders: list[asyncio.Task] = []
+        self.is_running = False
+
+    def start(self, consume: Callable[..., Awaitable]):
+        if self.is_running:
+            return
+        self.slots = asyncio.Semaphore(self.queue_size)
+        self.items: dict[object, deque[tuple]] = {}
+        self.order: deque = deque()
+        self.cooldowns: dict[object, float] = {}
+        self.busy: set = set()
+        self.pending = 0
+        self.changed = asyncio.Condition()
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.uploaders = [
+            asyncio.create_task(self.__upload_worker(consume))
+            for _ in range(self.upload_workers)
+        ]
+        self.is_running = True
+        logging.info(
+            msg=f"Started pipeline: {self.download_workers} downloaders, {self.upload_workers} uploaders, queue of {self.queue_size}"
+        )
+
+    async def stop(self):
+        if not self.is_running:
+            return
+        await self.idle.wait()
+        for task in self.uploaders:
+            task.cancel()
+        await asyncio.gather(*self.uploaders, return_exceptions=True)
+        self.uploaders.clear()
+        self.is_running = False
+        logging.info(msg="Stopped pipeline")
+
+    async def put(self, *item):
+        await self.slots.acquire()
+        async with self.changed:
+            self.pending += 1
+            PIPELINE_PENDING.set(self.pending)
+            self.idle.clear()
+            self.__push(item)
+
+    async def put_backfill(self, *item):
+        # keep the rest of the queue free for new photos
+        async with self.changed:
+            await self.changed.wait_for(lambda: self.pending < self.backfill_queue_size)
+        await self.put(*item)
+
+    def __push(self, item: tuple, is_retry: bool = False):
+        key = item[0]
+        if key not in self.items:
+            self.items[key] = deque()
+            self.order.append(key)
+        if is_retry:
+            self.items[key].appendleft(item)
+        else:
+            self.items[key].append(item)
+        self.changed.notify_all()
+
+    async def __take(self):
+        async with self.changed:
+            while True:
+                now = time.monotonic()
+                for _ in range(len(self.order)):
+                    key = self.order[0]
+                    self.order.rotate(-1)
+                    if key in self.busy or self.cooldowns.get(key, 0) > now:
+                        continue
+                    self.cooldowns.pop(key, None)
+                    item = self.items[key].popleft()
+                    if not self.items[key]:
+                        del self.items[key]
+                        self.order.remove(key)
+                    self.busy.add(key)
+                    return item
+
+                waits = [
+                    self.cooldowns[key] - now
+                    for key in self.order
+                    if key not in self.busy and key in self.cooldowns
+                ]
+                try:
+                    await asyncio.wait_for(
+                        self.changed.wait(), min(waits) if waits else None
+                    )
+                except asyncio.TimeoutError:
+                    pass
+
+    async def __done(self, item: tuple, retry: tuple[float, tuple] | None):
+        key = item[0]
+        async with self.changed:
+            self.busy.discard(key)
+            if retry is not None:
+                retry_after, item = retry
+                self.cooldowns[key] = time.monotonic() + retry_after
+                logging.info(msg=f"Postponing uploads to {key} for {retry_after} seconds")
+                self.__push(item, is_retry=True)
+                return
+            self.pending -= 1
+            PIPELINE_PENDING.set(self.pending)
+            self.slots.release()
+            if self.pending == 0:
+                self.idle.set()
+            self.changed.notify_all()
+
+    async def run(
+        self,
+        chats_ids: list[int | str],
+        produce: Callable[[int | str, Callable[..., Awaitable]], Awaitable],
+    ):
+        chats = asyncio.Queue()
+        for chat_id in chats_ids:
+            chats.put_nowait(chat_id)
+
+        workers_amount = min(self.download_workers, len(chats_ids))
+        await asyncio.gather(
+            *[self.__download_worker(chats, produce) for _ in range(workers_amount)]
+        )
+        await self.idle.wait()
+
+    async def __download_worker(self, chats: asyncio.Queue, produce):
+        while True:
+            try:
+                chat_id = chats.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                await produce(chat_id, self.put)
+            except Exception as err:
+                logging.error(
+                    msg=f"Failed to download {chat_id}:{err.__class__.__name__}:{err}"
+                )
+
+    async def __upload_worker(self, consume):
+        while True:
+            item = await self.__take()
+            retry = None
+            try:
+                retry = await consume(*item)
+            except Exception as err:
+                logging.error(msg=f"Failed to upload:{err.__class__.__name__}:{err}")
+            finally:
+                await self.__done(item, retry)
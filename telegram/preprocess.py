@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from PIL import Image, ImageOps
+
+
+def recompress(
+    source: bytes | str, max_edge: int, quality: int
+) -> tuple[bytes | None, int, int, float]:
+    started = time.process_time()
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            content = f.read()
+    else:
+        content = source
+
+    with Image.open(BytesIO(content)) as image:
+        image = ImageOps.exif_transpose(image).convert("RGB")
+    image.thumbnail((max_edge, max_edge))
+    output = BytesIO()
+    image.save(output, "JPEG", quality=quality, optimize=True)
+    data = output.getvalue()
+    elapsed = time.process_time() - started
+
+    if len(data) >= len(content):
+        return None, len(content), len(content), elapsed
+    if isinstance(source, str):
+        tmp_path = f"{source}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, source)
+        return None, len(content), len(data), elapsed
+    return data, len(content), len(data), elapsed
+
+
+class PhotoPreprocessor:
+    def __init__(
+        self,
+        enabled: bool,
+        workers: int,
+        max_edge: int,
+        quality: int,
+        min_size_kb: int,
+    ):
+        self.enabled = enabled
+        self.workers = workers
+        self.max_edge = max_edge
+        self.quality = quality
+        self.min_size = min_size_kb * 1024
+        self.executor: ProcessPoolExecutor | None = None
+        self.stats = {
+            "processed": 0,
+            "skipped": 0,
+            "failed": 0,
+            "bytes_in": 0,
+            "bytes_out": 0,
+            "cpu_seconds": 0.0,
+            "wall_seconds": 0.0,
+        }
+
+    async def process(self, source: BytesIO | str, size: int):
+        if size < self.min_size:
+            self.stats["skipped"] += 1
+            return
+
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        loop = asyncio.get_running_loop()
+        content = source.getvalue() if isinstance(source, BytesIO) else source
+        started = time.monotonic()
+        try:
+            data, size_in, size_out, elapsed = await loop.run_in_executor(
+                self.executor, recompress, content, self.max_edge, self.quality
+            )
+        except Exception as err:
+            self.stats["failed"] += 1
+            logging.error(msg=f"Failed to preprocess photo:{err.__class__.__name__}:{err}")
+            return
+        wall = time.monotonic() - started
+
+        if data is not None:
+            source.seek(0)
+            source.write(data)
+            source.truncate()
+        self.stats["processed" if size_out < size_in else "skipped"] += 1
+        self.stats["bytes_in"] += size_in
+        self.stats["bytes_out"] += size_out
+        self.stats["cpu_seconds"] += elapsed
+        self.stats["wall_seconds"] += wall
+        logging.debug(
+            msg=f"Preprocessed photo: {size_in} -> {size_out} bytes in {wall:.2f}s ({elapsed:.2f}s CPU)"
+        )
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        stats["bytes_saved"] = stats["bytes_in"] - stats["bytes_out"]
+        return stats
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
@@ -0,0 +1,30 @@
+from pyrogram.enums import MessageMediaType
+from pyrogram.types import Message
+
+
+class MessageRecord:
+    __slots__ = (
+        "id",
+        "chat_id",
+        "date",
+        "media",
+        "media_group_id",
+        "text",
+        "caption",
+        "file_id",
+        "file_size",
+    )
+
+    def __init__(self, mes: Message):
+        self.id: int = mes.id
+        self.chat_id: int = mes.chat.id
+        self.date: float = mes.date.timestamp() if mes.date else 0.0
+        self.media: MessageMediaType | None = mes.media
+        self.media_group_id: str | None = mes.media_group_id
+        # pyrogram's Str keeps the entities alive, so copy into plain strings
+        self.text: str | None = str(mes.text) if mes.text is not None else None
+        self.caption: str | None = (
+            str(mes.caption) if mes.caption is not None else None
+        )
+        self.file_id: str | None = mes.photo.file_id if mes.photo else None
+        self.file_size: int = (mes.photo.file_size or 0) if mes.photo else 0
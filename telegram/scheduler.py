@@ -0,0 +1,103 @@
+import logging
+import time
+
+RATE_SMOOTHING = 0.5
+DUE_TOLERANCE = 1
+
+
+class ChatScheduler:
+    def __init__(
+        self,
+        failure_backoff: int,
+        min_interval: int,
+        max_interval: int,
+        target_messages: int,
+    ):
+        self.failure_backoff = failure_backoff
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target_messages = target_messages
+        self.interval = max_interval
+        self.rotation = 0
+        self.failures: dict[int, int] = {}
+        self.blocked_until: dict[int, float] = {}
+        self.intervals: dict[int, float] = {}
+        self.rates: dict[int, float] = {}
+        self.polled_at: dict[int, float] = {}
+
+    def __clamp(self, interval: float) -> float:
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def reset(self, interval: int):
+        self.interval = self.__clamp(interval)
+        self.intervals.clear()
+        self.rates.clear()
+        self.polled_at.clear()
+
+    def get_interval(self, chat_id: int) -> float:
+        return self.intervals.get(chat_id, self.interval)
+
+    def get_next_poll(self, chat_id: int) -> float:
+        polled_at = self.polled_at.get(chat_id)
+        next_poll = 0 if polled_at is None else polled_at + self.get_interval(chat_id)
+        return max(next_poll, self.blocked_until.get(chat_id, 0))
+
+    def get_due(self, chats_ids: list[int]) -> list[int]:
+        now = time.monotonic() + DUE_TOLERANCE
+        due = [chat_id for chat_id in chats_ids if self.get_next_poll(chat_id) <= now]
+        if due:
+            shift = self.rotation % len(due)
+            due = due[shift:] + due[:shift]
+        self.rotation += 1
+        return due
+
+    def get_sleep(self, chats_ids: list[int]) -> float:
+        if not chats_ids:
+            return self.interval
+        next_poll = min(self.get_next_poll(chat_id) for chat_id in chats_ids)
+        return self.__clamp(next_poll - time.monotonic())
+
+    def get_schedule(self, chats_ids: list[int]) -> list[tuple]:
+        now = time.monotonic()
+        return [
+            (
+                chat_id,
+                self.get_interval(chat_id),
+                max(0, self.get_next_poll(chat_id) - now),
+                self.rates.get(chat_id, 0) * 3600,
+            )
+            for chat_id in chats_ids
+        ]
+
+    def on_success(self, chat_id: int, found: int):
+        self.failures.pop(chat_id, None)
+        self.blocked_until.pop(chat_id, None)
+
+        now = time.monotonic()
+        polled_at = self.polled_at.get(chat_id)
+        self.polled_at[chat_id] = now
+        if polled_at is None:
+            return
+
+        rate = found / max(1, now - polled_at)
+        if chat_id in self.rates:
+            rate = RATE_SMOOTHING * rate + (1 - RATE_SMOOTHING) * self.rates[chat_id]
+        self.rates[chat_id] = rate
+
+        if rate > 0:
+            interval = self.target_messages / rate
+        else:
+            interval = self.get_interval(chat_id) * 2
+        self.intervals[chat_id] = self.__clamp(interval)
+        logging.debug(
+            msg=f"Next poll of {chat_id} in {self.intervals[chat_id]:.0f} seconds ({rate * 3600:.1f} messages/hour)"
+        )
+
+    def on_failure(self, chat_id: int):
+        failures = self.failures.get(chat_id, 0) + 1
+        self.failures[chat_id] = failures
+        delay = self.failure_backoff * 2 ** (failures - 1)
+        self.blocked_until[chat_id] = time.monotonic() + delay
+        logging.warning(
+            msg=f"Skipping {chat_id} for {delay} seconds after {failures} failures"
+        )
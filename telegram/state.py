@@ -0,0 +1,439 @@
+import json
+import logging
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+
+JSON_PATH = "telegram/chats_data.json"
+
+
+class StateStore(ABC):
+    @abstractmethod
+    def get_active(self) -> list[int]:
+        ...
+
+    @abstractmethod
+    def add_active(self, chat_id: int):
+        ...
+
+    @abstractmethod
+    def remove_active(self, chat_id: int):
+        ...
+
+    @abstractmethod
+    def get_albums_ids(self) -> dict[str, int]:
+        ...
+
+    @abstractmethod
+    def set_album_id(self, chat_id: str, album_id: int):
+        ...
+
+    @abstractmethod
+    def remove_album_id(self, chat_id: str):
+        ...
+
+    @abstractmethod
+    def get_albums_owners(self) -> dict[str, int]:
+        ...
+
+    @abstractmethod
+    def set_album_owner(self, chat_id: str, owner_id: int):
+        ...
+
+    @abstractmethod
+    def get_cursor(self, chat_id: str) -> int | None:
+        ...
+
+    @abstractmethod
+    def set_cursor(self, chat_id: str, message_id: int):
+        ...
+
+    @abstractmethod
+    def remove_cursor(self, chat_id: str):
+        ...
+
+    @abstractmethod
+    def get_chats_meta(self) -> dict[int, dict]:
+        ...
+
+    @abstractmethod
+    def set_chat_meta(self, chat_id: int, meta: dict):
+        ...
+
+    @abstractmethod
+    def remove_chat_meta(self, chat_id: int):
+        ...
+
+    @abstractmethod
+    def get_backfills(self) -> dict[int, dict]:
+        ...
+
+    @abstractmethod
+    def add_backfill(self, job: dict) -> int:
+        ...
+
+    @abstractmethod
+    def set_backfill(self, job_id: int, job: dict):
+        ...
+
+    @abstractmethod
+    def remove_backfill(self, job_id: int):
+        ...
+
+    @abstractmethod
+    def get_meta(self, key: str) -> str | None:
+        ...
+
+    @abstractmethod
+    def set_meta(self, key: str, value: str):
+        ...
+
+
+class JsonStateStore(StateStore):
+    def __init__(self, path: str = JSON_PATH):
+        self.path = path
+        if not os.path.exists(path):
+            self.data = {"active": [], "cursors": {}, "albums_ids": {}}
+            self.__dump()
+        else:
+            with open(path) as f:
+                self.data = json.load(f)
+        self.data.setdefault("chats", {})
+        self.data.setdefault("albums_owners", {})
+        self.data.setdefault("backfill", {})
+        self.data.setdefault("meta", {})
+        if "posted" in self.data:
+            self.data["cursors"] = {
+                chat_id: max(messages_ids)
+                for chat_id, messages_ids in self.data.pop("posted").items()
+                if messages_ids
+            }
+            self.__dump()
+
+    def __dump(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.data, f, indent=4)
+        os.replace(tmp_path, self.path)
+
+    def get_active(self):
+        return list(self.data["active"])
+
+    def add_active(self, chat_id: int):
+        if chat_id not in self.data["active"]:
+            self.data["active"].append(chat_id)
+            self.__dump()
+
+    def remove_active(self, chat_id: int):
+        if chat_id in self.data["active"]:
+            self.data["active"].remove(chat_id)
+            self.__dump()
+
+    def get_albums_ids(self):
+        return dict(self.data["albums_ids"])
+
+    def set_album_id(self, chat_id: str, album_id: int):
+        self.data["albums_ids"][chat_id] = album_id
+        self.__dump()
+
+    def remove_album_id(self, chat_id: str):
+        self.data["albums_ids"].pop(chat_id, None)
+        self.data["albums_owners"].pop(chat_id, None)
+        self.__dump()
+
+    def get_albums_owners(self):
+        return dict(self.data["albums_owners"])
+
+    def set_album_owner(self, chat_id: str, owner_id: int):
+        self.data["albums_owners"][chat_id] = owner_id
+        self.__dump()
+
+    def get_cursor(self, chat_id: str):
+        return self.data["cursors"].get(chat_id)
+
+    def set_cursor(self, chat_id: str, message_id: int):
+        self.data["cursors"][chat_id] = message_id
+        self.__dump()
+
+    def remove_cursor(self, chat_id: str):
+        self.data["cursors"].pop(chat_id, None)
+        self.__dump()
+
+    def get_chats_meta(self):
+        return {int(chat_id): meta for chat_id, meta in self.data["chats"].items()}
+
+    def set_chat_meta(self, chat_id: int, meta: dict):
+        self.data["chats"][str(chat_id)] = meta
+        self.__dump()
+
+    def remove_chat_meta(self, chat_id: int):
+        self.data["chats"].pop(str(chat_id), None)
+        self.__dump()
+
+    def get_backfills(self):
+        return {int(job_id): dict(job) for job_id, job in self.data["backfill"].items()}
+
+    def add_backfill(self, job: dict):
+        job_id = max(map(int, self.data["backfill"]), default=0) + 1
+        self.data["backfill"][str(job_id)] = job
+        self.__dump()
+        return job_id
+
+    def set_backfill(self, job_id: int, job: dict):
+        self.data["backfill"][str(job_id)] = job
+        self.__dump()
+
+    def remove_backfill(self, job_id: int):
+        self.data["backfill"].pop(str(job_id), None)
+        self.__dump()
+
+    def get_meta(self, key: str):
+        return self.data["meta"].get(key)
+
+    def set_meta(self, key: str, value: str):
+        self.data["meta"][key] = value
+        self.__dump()
+
+
+class SqliteStateStore(StateStore):
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                );
+                CREATE TABLE IF NOT EXISTS active (
+                    chat_id INTEGER PRIMARY KEY,
+                    position INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS albums (
+                    chat_id INTEGER PRIMARY KEY,
+                    album_id INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS album_owners (
+                    chat_id INTEGER PRIMARY KEY,
+                    owner_id INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS cursors (
+                    chat_id INTEGER PRIMARY KEY,
+                    message_id INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS chats (
+                    chat_id INTEGER PRIMARY KEY,
+                    title TEXT,
+                    username TEXT,
+                    type TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS backfill (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    chat_id INTEGER NOT NULL,
+                    offset_id INTEGER NOT NULL,
+                    min_id INTEGER NOT NULL,
+                    min_date INTEGER NOT NULL,
+                    remaining INTEGER
+                );
+                """
+            )
+        self.__migrate_json()
+        self.__migrate_posted()
+
+    def __migrate_json(self, json_path: str = JSON_PATH):
+        is_migrated = self.conn.execute(
+            "SELECT 1 FROM meta WHERE key = 'json_migrated'"
+        ).fetchone()
+        if is_migrated:
+            return
+        with self.conn:
+            if os.path.exists(json_path):
+                with open(json_path) as f:
+                    data = json.load(f)
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO active VALUES (?, ?)",
+                    [(int(id), pos) for pos, id in enumerate(data["active"])],
+                )
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO albums VALUES (?, ?)",
+                    [(int(id), album) for id, album in data["albums_ids"].items()],
+                )
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO cursors VALUES (?, ?)",
+                    [
+                        (int(id), max(mes_ids))
+                        for id, mes_ids in data.get("posted", {}).items()
+                        if mes_ids
+                    ]
+                    + [
+                        (int(id), mes_id)
+                        for id, mes_id in data.get("cursors", {}).items()
+                    ],
+                )
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO chats VALUES (?, ?, ?, ?)",
+                    [
+                        (int(id), meta["title"], meta["username"], meta["type"])
+                        for id, meta in data.get("chats", {}).items()
+                    ],
+                )
+                logging.info(msg=f"Migrated {json_path} to {self.path}")
+            self.conn.execute("INSERT INTO meta VALUES ('json_migrated', '1')")
+        if os.path.exists(json_path):
+            os.replace(json_path, f"{json_path}.bak")
+
+    def __migrate_posted(self):
+        has_posted = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'posted'"
+        ).fetchone()
+        if not has_posted:
+            return
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO cursors "
+                "SELECT chat_id, MAX(message_id) FROM posted GROUP BY chat_id"
+            )
+            self.conn.execute("DROP TABLE posted")
+
+    def get_active(self):
+        rows = self.conn.execute("SELECT chat_id FROM active ORDER BY position")
+        return [chat_id for chat_id, in rows]
+
+    def add_active(self, chat_id: int):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO active "
+                "SELECT ?, COALESCE(MAX(position) + 1, 0) FROM active",
+                (int(chat_id),),
+            )
+
+    def remove_active(self, chat_id: int):
+        with self.conn:
+            self.conn.execute("DELETE FROM active WHERE chat_id = ?", (int(chat_id),))
+
+    def get_albums_ids(self):
+        rows = self.conn.execute("SELECT chat_id, album_id FROM albums")
+        return {str(chat_id): album_id for chat_id, album_id in rows}
+
+    def set_album_id(self, chat_id: str, album_id: int):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO albums VALUES (?, ?)", (int(chat_id), album_id)
+            )
+
+    def remove_album_id(self, chat_id: str):
+        with self.conn:
+            self.conn.execute("DELETE FROM albums WHERE chat_id = ?", (int(chat_id),))
+            self.conn.execute(
+                "DELETE FROM album_owners WHERE chat_id = ?", (int(chat_id),)
+            )
+
+    def get_albums_owners(self):
+        rows = self.conn.execute("SELECT chat_id, owner_id FROM album_owners")
+        return {str(chat_id): owner_id for chat_id, owner_id in rows}
+
+    def set_album_owner(self, chat_id: str, owner_id: int):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO album_owners VALUES (?, ?)",
+                (int(chat_id), owner_id),
+            )
+
+    def get_cursor(self, chat_id: str):
+        row = self.conn.execute(
+            "SELECT message_id FROM cursors WHERE chat_id = ?", (int(chat_id),)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_cursor(self, chat_id: str, message_id: int):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cursors VALUES (?, ?)",
+                (int(chat_id), message_id),
+            )
+
+    def remove_cursor(self, chat_id: str):
+        with self.conn:
+            self.conn.execute("DELETE FROM cursors WHERE chat_id = ?", (int(chat_id),))
+
+    def get_chats_meta(self):
+        rows = self.conn.execute("SELECT chat_id, title, username, type FROM chats")
+        return {
+            chat_id: {"title": title, "username": username, "type": type}
+            for chat_id, title, username, type in rows
+        }
+
+    def set_chat_meta(self, chat_id: int, meta: dict):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO chats VALUES (?, ?, ?, ?)",
+                (int(chat_id), meta["title"], meta["username"], meta["type"]),
+            )
+
+    def remove_chat_meta(self, chat_id: int):
+        with self.conn:
+            self.conn.execute("DELETE FROM chats WHERE chat_id = ?", (int(chat_id),))
+
+    def get_backfills(self):
+        rows = self.conn.execute(
+            "SELECT id, chat_id, offset_id, min_id, min_date, remaining FROM backfill "
+            "ORDER BY id"
+        )
+        return {
+            job_id: {
+                "chat_id": chat_id,
+                "offset_id": offset_id,
+                "min_id": min_id,
+                "min_date": min_date,
+                "remaining": remaining,
+            }
+            for job_id, chat_id, offset_id, min_id, min_date, remaining in rows
+        }
+
+    def add_backfill(self, job: dict):
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO backfill "
+                "(chat_id, offset_id, min_id, min_date, remaining) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    job["chat_id"],
+                    job["offset_id"],
+                    job["min_id"],
+                    job["min_date"],
+                    job["remaining"],
+                ),
+            )
+        return cursor.lastrowid
+
+    def set_backfill(self, job_id: int, job: dict):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE backfill SET offset_id = ?, remaining = ? WHERE id = ?",
+                (job["offset_id"], job["remaining"], job_id),
+            )
+
+    def remove_backfill(self, job_id: int):
+        with self.conn:
+            self.conn.execute("DELETE FROM backfill WHERE id = ?", (job_id,))
+
+    def get_meta(self, key: str):
+        row = self.conn.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
+
+
+def get_state_store(backend: str, path: str) -> StateStore:
+    if backend == "json":
+        return JsonStateStore()
+    if backend == "sqlite":
+        return SqliteStateStore(path)
+    raise ValueError(f"unknown state backend: {backend}")
@@ -0,0 +1,62 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable
+from .records import MessageRecord
+
+
+class PhotoStream:
+    def __init__(self, enabled: bool, media_group_wait: float):
+        self.enabled = enabled
+        self.media_group_wait = media_group_wait
+        self.pending: dict[int, list[MessageRecord]] = {}
+        self.timers: dict[int, asyncio.Task] = {}
+        self.deferred: dict[int, asyncio.Task] = {}
+
+    def push(
+        self,
+        mes: MessageRecord,
+        flush: Callable[[int, list[MessageRecord]], Awaitable],
+    ):
+        chat_id = mes.chat_id
+        self.pending.setdefault(chat_id, []).append(mes)
+        timer = self.timers.pop(chat_id, None)
+        if timer is not None:
+            timer.cancel()
+        self.timers[chat_id] = asyncio.create_task(self.__flush_later(chat_id, flush))
+
+    def defer(self, chat_id: int, delay: float, flush: Callable[[int], Awaitable]):
+        if chat_id in self.deferred:
+            return
+        self.deferred[chat_id] = asyncio.create_task(
+            self.__flush_deferred(chat_id, delay, flush)
+        )
+
+    def cancel(self):
+        for timer in [*self.timers.values(), *self.deferred.values()]:
+            timer.cancel()
+        self.timers.clear()
+        self.deferred.clear()
+        self.pending.clear()
+
+    async def __flush_later(self, chat_id: int, flush):
+        await asyncio.sleep(self.media_group_wait)
+        self.timers.pop(chat_id, None)
+        messages = self.pending.pop(chat_id, [])
+        messages.sort(key=lambda mes: mes.id, reverse=True)
+        logging.info(msg=f"Received {len(messages)} new messages in {chat_id}")
+        try:
+            await flush(chat_id, messages)
+        except Exception as err:
+            logging.error(
+                msg=f"Failed to flush {chat_id}:{err.__class__.__name__}:{err}"
+            )
+
+    async def __flush_deferred(self, chat_id: int, delay: float, flush):
+        await asyncio.sleep(delay)
+        self.deferred.pop(chat_id, None)
+        try:
+            await flush(chat_id)
+        except Exception as err:
+            logging.error(
+                msg=f"Failed to flush {chat_id}:{err.__class__.__name__}:{err}"
+            )
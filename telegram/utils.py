@@ -23,11 +23,31 @@ def get_chats_descs(chats: list[Chat]):
     return "\n".join(output)
 
 
+def get_schedule_descs(schedule: list[tuple[Chat, float, float, float]]):
+    return "\n".join(
+        [
+            f"<b>•</b>  {chat.title} — раз в <b>{format_interval(int(interval))}</b>, "
+            f"{format_due_in(due_in)} <i>({rate:.1f} сообщ./ч.)</i>"
+            for chat, interval, due_in, rate in schedule
+        ]
+    )
+
+
+def format_due_in(due_in: float):
+    if int(due_in) <= 0:
+        return "сейчас"
+    return f"через {format_interval(int(due_in))}"
+
+
 def format_usernames_list(usernames: list[str]):
     return "\n".join([f"<b>•</b>  {username}" for username in usernames])
 
 
 def format_interval(seconds: int):
+    days, seconds = divmod(seconds, 24 * 60 * 60)
+    if days != 0:
+        rest = format_interval(seconds) if seconds >= 60 else ""
+        return f"{days} дн. {rest}".rstrip()
     formatted = datetime(1, 1, 1, 0, 0, 0, 0) + timedelta(seconds=seconds)
     if formatted.hour != 0:
         format = "%H ч. %M мин." if formatted.minute != 0 else "%H ч."
@@ -39,5 +59,32 @@ def format_interval(seconds: int):
             return formatted.strftime("%S сек.").lstrip('0')
 
 
+def format_mb(size: float):
+    return f"{size / 1024 / 1024:.1f}"
+
+
+def format_latencies(latencies: dict[str, float]):
+    if not latencies:
+        return "—"
+    return "\n".join(
+        [
+            f"<b>•</b>  <code>{method}</code> — {latency:.2f} сек."
+            for method, latency in sorted(latencies.items())
+        ]
+    )
+
+
+def format_counts(counts: dict[str, float]):
+    if not counts:
+        return "нет"
+    return ", ".join([f"{key}: {int(count)}" for key, count in sorted(counts.items())])
+
+
+def parse_backfill_limit(arg: str) -> tuple[int | None, int]:
+    if arg.isdigit():
+        return int(arg), 0
+    return None, int(datetime.strptime(arg, "%d.%m.%Y").timestamp())
+
+
 def get_now():
     return datetime.now().strftime("[%H:%M:%S]")
@@ -2,13 +2,24 @@ import asyncio
 import vk_api
 import requests
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from functools import partial
+from io import BytesIO
+from typing import Callable
+from metrics import PHOTOS_UPLOADED, VK_ERRORS, VK_REQUEST_SECONDS
+from metrics import VK_RETRIES
+from .account import VkAccount
 from .errors import AccessDenied, OutOfTries
+from .limiter import FLOOD_CONTROL_CODE, TOO_MANY_RPS_CODE, RateLimiter
+
+UPLOAD_BATCH_SIZE = 5
 
 
 class VkAlbum:
     def __init__(
         self,
-        token: str,
+        tokens: list[str],
         retry_seconds: int,
         json_decode_retry_seconds: int,
         upload_fail_retry_seconds: int,
@@ -17,6 +28,12 @@ class VkAlbum:
         anti_flood_retry_seconds: int,
         photo_upload_max_tries: int,
         pack_upload_max_tries: int,
+        executor_workers: int,
+        requests_per_second: float,
+        uploads_per_hour: int,
+        flood_backoff_seconds: int,
+        rate_limit_max_tries: int,
+        albums_ttl: int,
     ):
         self.RETRY_SECONDS = retry_seconds
         self.JSON_DECODE_RETRY = json_decode_retry_seconds
@@ -26,172 +43,372 @@ class VkAlbum:
         self.ANTI_FLOOD_RETRY = anti_flood_retry_seconds
         self.PHOTO_UPLOAD_MT = photo_upload_max_tries
         self.PACK_UPLOAD_MT = pack_upload_max_tries
+        self.RATE_LIMIT_MT = rate_limit_max_tries
 
-        self.session = vk_api.VkApi(token=token)
-        self.vk = self.session.get_api()
-        self.login_user = self.__get_login_user()
-        self.login_user_id = self.login_user["id"]
-        logging.info(
-            msg=f"Logged in VK as {self.login_user['first_name']} {self.login_user['last_name']} @id{self.login_user_id}"
+        self.executor = ThreadPoolExecutor(
+            max_workers=executor_workers * len(tokens), thread_name_prefix="vk"
         )
+        self.accounts = [
+            VkAccount(
+                token,
+                executor_workers,
+                RateLimiter(
+                    requests_per_second,
+                    uploads_per_hour,
+                    flood_backoff_seconds,
+                    anti_flood_retry_seconds,
+                ),
+                albums_ttl,
+            )
+            for token in tokens
+        ]
+        self.album_accounts: dict[int, VkAccount] = {}
 
-    async def create_album(self, title: str) -> dict[str]:
-        return await self.__call_vk_method(
-            self.vk.photos.createAlbum, title=title, privacy_view=["only_me"]
+    def __get_account(self, album_id: int) -> VkAccount:
+        return self.album_accounts.get(album_id, self.accounts[0])
+
+    def __get_ranked_accounts(self, key: int | str) -> list[VkAccount]:
+        return sorted(
+            self.accounts, key=lambda account: account.get_weight(key), reverse=True
+        )
+
+    def set_album_owner(self, album_id: int, owner_id: int):
+        for account in self.accounts:
+            if account.user_id == owner_id:
+                self.album_accounts[album_id] = account
+                return
+
+    def get_owner_id(self, album_id: int) -> int:
+        return self.__get_account(album_id).user_id
+
+    async def create_album(self, title: str, key: int | str | None = None) -> dict[str]:
+        ranked = self.__get_ranked_accounts(title if key is None else key)
+        account = next((account for account in ranked if account.is_available), None)
+        if account is None:
+            account = ranked[0]
+        elif account is not ranked[0]:
+            logging.warning(
+                msg=f"@id{ranked[0].user_id} is throttled. Creating {title} on @id{account.user_id}"
+            )
+        album = await self.__call_vk_method(
+            account,
+            account.vk.photos.createAlbum,
+            title=title,
+            privacy_view=["only_me"],
         )
+        if album is not None:
+            album.setdefault("owner_id", account.user_id)
+            account.albums.add(album)
+            self.album_accounts[album["id"]] = account
+        return album
 
     async def remove_album(self, album_id: int):
-        return await self.__call_vk_method(
-            self.vk.photos.deleteAlbum, album_id=album_id
+        account = self.__get_account(album_id)
+        output = await self.__call_vk_method(
+            account, account.vk.photos.deleteAlbum, album_id=album_id
+        )
+        account.albums.remove(album_id)
+        account.upload_urls.pop(album_id, None)
+        self.album_accounts.pop(album_id, None)
+        return output
+
+    async def __run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, partial(func, *args, **kwargs)
         )
 
-    def __upload_photo(self, album_id: int, path_to_photo: str, caption: str):
-        upload_url = self.vk.photos.getUploadServer(album_id=album_id)["upload_url"]
-        with open(path_to_photo, "rb") as file:
-            files = {"file1": file}
-            with requests.post(upload_url, files=files) as res:
-                data = res.json()
+    def __post_photos(
+        self, account: VkAccount, upload_url: str, sources: list[str | BytesIO]
+    ):
+        with ExitStack() as stack:
+            files = {}
+            for ind, source in enumerate(sources, 1):
+                if isinstance(source, BytesIO):
+                    source.seek(0)
+                    files[f"file{ind}"] = (f"photo{ind}.jpeg", source)
+                else:
+                    files[f"file{ind}"] = stack.enter_context(open(source, "rb"))
+            with account.session.http.post(upload_url, files=files) as res:
+                return res.json()
+
+    async def __get_upload_url(self, account: VkAccount, album_id: int):
+        if album_id not in account.upload_urls:
+            upload_server = await self.__request(
+                account, account.vk.photos.getUploadServer, album_id=album_id
+            )
+            account.upload_urls[album_id] = upload_server["upload_url"]
+        return account.upload_urls[album_id]
+
+    async def __upload_batch(
+        self,
+        album_id: int,
+        batch: list[tuple[str | BytesIO, str]],
+        on_uploaded: Callable | None = None,
+    ):
+        account = self.__get_account(album_id)
+        sources = [source for source, _ in batch]
+        caption = batch[0][1]
+        upload_url = await self.__get_upload_url(account, album_id)
+        await account.limiter.acquire_upload(len(sources))
+        with VK_REQUEST_SECONDS.time(method="upload"):
+            data = await self.__run(self.__post_photos, account, upload_url, sources)
+        if on_uploaded is not None:
+            on_uploaded(batch)
 
-        self.vk.photos.save(
+        saved = await self.__request(
+            account,
+            account.vk.photos.save,
             album_id=album_id,
             server=data["server"],
             photos_list=data["photos_list"],
             hash=data["hash"],
             caption=caption[:2048],
         )
+        PHOTOS_UPLOADED.inc(len(batch))
+        return saved
 
-    async def __upload_photo_wrapper(
-        self, album_id: int, path_to_photo: str, caption: str, trying: int = 0
+    async def __upload_batch_wrapper(
+        self,
+        album_id: int,
+        batch: list[tuple[str | BytesIO, str]],
+        on_uploaded: Callable | None = None,
+        trying: int = 0,
     ):
         try:
-            self.__upload_photo(album_id, path_to_photo, caption)
-        except requests.exceptions.JSONDecodeError as err:
-            if trying >= self.PHOTO_UPLOAD_MT:
+            return await self.__upload_batch(album_id, batch, on_uploaded)
+        except Exception as err:
+            account = self.__get_account(album_id)
+            account.upload_urls.pop(album_id, None)
+            retry_seconds, reason = await self.__get_upload_retry(account, err)
+            if retry_seconds is None:
                 raise OutOfTries("uploading photos")
-
-            logging.error(
-                msg=f"Failed to decode json. Retrying in {self.JSON_DECODE_RETRY} seconds..."
-            )
-            await asyncio.sleep(self.JSON_DECODE_RETRY)
-
-            trying += 1
-            await self.__upload_photo_wrapper(album_id, path_to_photo, caption)
-
-        except vk_api.exceptions.ApiError as err:
             if trying >= self.PHOTO_UPLOAD_MT:
-                raise OutOfTries("uploading photos")
+                raise OutOfTries("uploading photos", retry_seconds)
 
-            err_text = err.__str__()
-            if "[100]" in err_text and "photos_list is invalid" in err_text:
-                logging.error(
-                    msg=f"Failed to upload photo to album. Retrying in {self.UPLOAD_FAIL_RETRY} seconds..."
-                )
-                await asyncio.sleep(self.UPLOAD_FAIL_RETRY)
-            elif "[200]" in err_text:
-                logging.error(
-                    msg=f"Access denied while uploading photo. Retrying in {self.ACCESS_DENIED_RETRY} seconds..."
-                )
-                await asyncio.sleep(self.ACCESS_DENIED_RETRY)
-            else:
-                return await self.__api_error_handler(
-                    err,
-                    "__upload_photo",
-                    album_id=album_id,
-                    path_to_photo=path_to_photo,
-                    caption=caption,
-                )
+            VK_RETRIES.inc(reason=getattr(err, "code", err.__class__.__name__))
+            logging.error(msg=f"{reason}. Retrying in {retry_seconds} seconds...")
+            await asyncio.sleep(retry_seconds)
 
             trying += 1
-            await self.__upload_photo_wrapper(album_id, path_to_photo, caption, trying)
-
-        except BaseException as err:
-            if trying >= self.PHOTO_UPLOAD_MT:
-                raise OutOfTries("uploading photos")
-
-            logging.error(
-                msg=f"{err.__class__.__name__}:{err}. Retrying in {self.RETRY_SECONDS} seconds..."
+            return await self.__upload_batch_wrapper(
+                album_id, batch, on_uploaded, trying
             )
-            await asyncio.sleep(self.RETRY_SECONDS)
 
-            trying += 1
-            await self.__upload_photo_wrapper(album_id, path_to_photo, caption)
+    async def __get_upload_retry(self, account: VkAccount, err: Exception):
+        if isinstance(err, requests.exceptions.JSONDecodeError):
+            return self.JSON_DECODE_RETRY, "Failed to decode json"
+        if isinstance(err, vk_api.exceptions.ApiError):
+            if err.code == 100 and "photos_list is invalid" in err.__str__():
+                return self.UPLOAD_FAIL_RETRY, "Failed to upload photo to album"
+            if err.code == 200:
+                return self.ACCESS_DENIED_RETRY, "Access denied while uploading photo"
+            await self.__api_error_handler(account, err, "__upload_batch")
+            return None, None
+        return self.RETRY_SECONDS, f"{err.__class__.__name__}:{err}"
+
+    def __get_batches(self, photos_data: list[tuple[str | BytesIO, str]]):
+        batches: list[list[tuple[str | BytesIO, str]]] = []
+        for data in photos_data:
+            _, caption = data
+            if (
+                batches
+                and len(batches[-1]) < UPLOAD_BATCH_SIZE
+                and batches[-1][-1][1] == caption
+            ):
+                batches[-1].append(data)
+            else:
+                batches.append([data])
+        return batches
 
     async def __upload_pack(
-        self, album_id: int, photos_data: list[tuple[str, str]], trying: int = 0
+        self,
+        album_id: int,
+        photos_data: list[tuple[str | BytesIO, str]],
+        on_uploaded: Callable | None = None,
+        on_saved: Callable | None = None,
+        batch_trying: int = 0,
     ):
         photos_amount = len(photos_data)
         logging.info(msg=f"Uploading {photos_amount} photos to {album_id}...")
+        failed = []
+        retry_after = 0
         i = 0
-        for ind, data in enumerate(photos_data):
-            path, caption = data
+        for batch in self.__get_batches(photos_data):
             try:
-                await self.__upload_photo_wrapper(album_id, path, caption)
-                await asyncio.sleep(1.5)
-                i += 1
+                saved = await self.__upload_batch_wrapper(
+                    album_id, batch, on_uploaded, batch_trying
+                )
+                if on_saved is not None:
+                    on_saved(batch, saved)
+                i += len(batch)
                 logging.debug(f"Uploaded {i}/{photos_amount}")
             except OutOfTries as err:
                 logging.info(msg=err.__str__())
-                return photos_data[ind:]
+                failed.extend(batch)
+                retry_after = max(retry_after, err.retry_after or self.PACK_FAIL_RETRY)
+        return failed, retry_after
 
     async def upload_photos_pack(
-        self, album_id: int, photos_data: list[tuple[str, str]], trying: int = 0
-    ):        
+        self,
+        album_id: int,
+        photos_data: list[tuple[str | BytesIO, str]],
+        on_uploaded: Callable | None = None,
+        on_saved: Callable | None = None,
+        trying: int = 0,
+    ) -> list[tuple[str | BytesIO, str]]:
         left = photos_data
         while trying < self.PACK_UPLOAD_MT:
-            left = await self.__upload_pack(album_id, left)
-            if left is None:
+            left, _ = await self.__upload_pack(album_id, left, on_uploaded, on_saved)
+            if not left:
                 break
-            logging.error(f"Failed to upload pack to {album_id} ({trying}). Retrying in {self.PACK_FAIL_RETRY} seconds...")
             trying += 1
+            if trying >= self.PACK_UPLOAD_MT:
+                break
+            logging.error(
+                f"Failed to upload {len(left)} photos to {album_id} ({trying}). Retrying in {self.PACK_FAIL_RETRY} seconds..."
+            )
             await asyncio.sleep(self.PACK_FAIL_RETRY)
 
-        if trying >= self.PACK_UPLOAD_MT:
+        if left:
             logging.info(f"Skipping uploading to {album_id}: out of tries")
+        return left
+
+    async def upload_photos_once(
+        self,
+        album_id: int,
+        photos_data: list[tuple[str | BytesIO, str]],
+        on_uploaded: Callable | None = None,
+        on_saved: Callable | None = None,
+    ) -> tuple[list[tuple[str | BytesIO, str]], float]:
+        return await self.__upload_pack(
+            album_id, photos_data, on_uploaded, on_saved, self.PHOTO_UPLOAD_MT
+        )
+
+    async def copy_photo(self, photo: dict, album_id: int, caption: str):
+        account = self.__get_account(album_id)
+        try:
+            photo_id = await self.__request(
+                account,
+                account.vk.photos.copy,
+                owner_id=photo["owner_id"],
+                photo_id=photo["photo_id"],
+            )
+            await self.__request(
+                account,
+                account.vk.photos.move,
+                target_album_id=album_id,
+                photo_id=photo_id,
+            )
+            if caption != photo["caption"]:
+                await self.__request(
+                    account,
+                    account.vk.photos.edit,
+                    owner_id=account.user_id,
+                    photo_id=photo_id,
+                    caption=caption[:2048],
+                )
+        except vk_api.exceptions.ApiError as err:
+            logging.error(
+                msg=f"Failed to copy photo{photo['owner_id']}_{photo['photo_id']} to {album_id}:{err}"
+            )
             return
+        return {"id": photo_id, "owner_id": account.user_id}
 
     async def get_albums(self):
+        items = []
+        for account in self.accounts:
+            albums = await self.__get_albums(account)
+            if albums is not None:
+                items.extend(albums["items"])
+        return {"count": len(items), "items": items}
+
+    async def __get_albums(self, account: VkAccount):
         return await self.__call_vk_method(
-            self.vk.photos.getAlbums, owner_id=self.login_user_id
+            account, account.vk.photos.getAlbums, owner_id=account.user_id
         )
 
-    async def get_album_by_title(self, name: str):
-        albums = await self.get_albums()
-        for album in albums["items"]:
-            if name in album["title"]:
+    async def __refresh_albums(self, account: VkAccount):
+        albums = await self.__get_albums(account)
+        if albums is not None:
+            account.albums.load(albums["items"])
+            logging.debug(
+                msg=f"Loaded {len(albums['items'])} albums of @id{account.user_id}"
+            )
+
+    async def __find_album(self, accounts: list[VkAccount], getter: Callable):
+        for account in accounts:
+            is_refreshed = account.albums.is_stale
+            if is_refreshed:
+                await self.__refresh_albums(account)
+            album = getter(account.albums)
+            if album is None and not is_refreshed:
+                await self.__refresh_albums(account)
+                album = getter(account.albums)
+            if album is not None:
+                self.album_accounts[album["id"]] = account
                 return album
 
-    def __get_login_user(self):
-        return self.vk.users.get()[0]
+    async def get_album_by_id(self, album_id: int):
+        account = self.__get_account(album_id)
+        others = [other for other in self.accounts if other is not account]
+        accounts = [account, *others]
+        return await self.__find_album(
+            accounts, lambda albums: albums.get_by_id(album_id)
+        )
+
+    async def get_album_by_title(self, name: str, key: int | str | None = None):
+        return await self.__find_album(
+            self.__get_ranked_accounts(name if key is None else key),
+            lambda albums: albums.get_by_title(name),
+        )
+
+    def get_limiter_state(self) -> list[dict]:
+        return [account.get_state() for account in self.accounts]
 
-    async def __call_vk_method(self, method, **kwargs):
+    async def __request(self, account: VkAccount, method, trying: int = 0, **kwargs):
+        await account.limiter.acquire()
         try:
-            output = method(**kwargs)
-            return output
+            with VK_REQUEST_SECONDS.time(method=method._method):
+                output = await self.__run(method, **kwargs)
         except vk_api.exceptions.ApiError as err:
-            await self.__api_error_handler(err, method, **kwargs)
+            VK_ERRORS.inc(code=err.code)
+            if err.code not in (TOO_MANY_RPS_CODE, FLOOD_CONTROL_CODE):
+                raise
+            account.limiter.on_error(err.code)
+            if trying >= self.RATE_LIMIT_MT:
+                raise
+            VK_RETRIES.inc(reason=err.code)
+            return await self.__request(account, method, trying + 1, **kwargs)
+        account.limiter.on_success()
+        return output
+
+    async def __call_vk_method(self, account: VkAccount, method, **kwargs):
+        try:
+            return await self.__request(account, method, **kwargs)
+        except vk_api.exceptions.ApiError as err:
+            await self.__api_error_handler(account, err, method)
 
     async def __api_error_handler(
         self,
+        account: VkAccount,
         err: vk_api.exceptions.ApiError,
         func: vk_api.vk_api.VkApiMethod | str,
-        **kwargs,
     ):
-        err_text = err.__str__()
         if isinstance(func, vk_api.vk_api.VkApiMethod):
             method = func._method
         else:
             method = func
-        logging.error(msg=f"{err.__class__.__name__}:{method}:{err_text}")
+        logging.error(msg=f"{err.__class__.__name__}:{method}:{err.__str__()}")
 
-        if "[9]" in err_text:
-            logging.info(
-                msg=f"Sleeping for {self.ANTI_FLOOD_RETRY // 3600:0.1f} hours and retrying..."
+        if err.code == FLOOD_CONTROL_CODE:
+            logging.error(
+                msg=f"Flood control did not lift after {self.RATE_LIMIT_MT} tries. Skipping {method}"
             )
-            await asyncio.sleep(self.ANTI_FLOOD_RETRY)
-            self.__call_vk_method(func, **kwargs)
-        elif "[5]" in err_text:
+        elif err.code == 5:
+            account.is_expired = True
             logging.error(
-                msg="VK token was expired. Please update it in `config.ini` file"
+                msg=f"VK token of @id{account.user_id} was expired. Please update it in `config.ini` file"
             )
-        elif "[200]" in err_text:
+        elif err.code == 200:
             raise AccessDenied(method)
@@ -0,0 +1,50 @@
+import hashlib
+import logging
+import time
+import vk_api
+from requests.adapters import HTTPAdapter
+from .albums import AlbumIndex
+from .limiter import TOO_MANY_RPS_CODE, RateLimiter
+
+
+class VkAccount:
+    def __init__(
+        self,
+        token: str,
+        pool_size: int,
+        limiter: RateLimiter,
+        albums_ttl: int,
+    ):
+        self.session = vk_api.VkApi(token=token)
+        self.session.RPS_DELAY = 0
+        self.session.error_handlers.pop(TOO_MANY_RPS_CODE, None)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.http.mount("https://", adapter)
+        self.session.http.mount("http://", adapter)
+        self.vk = self.session.get_api()
+        self.limiter = limiter
+        self.albums = AlbumIndex(albums_ttl)
+        self.upload_urls: dict[int, str] = {}
+        self.is_expired = False
+
+        self.user = self.vk.users.get()[0]
+        self.user_id = self.user["id"]
+        logging.info(
+            msg=f"Logged in VK as {self.user['first_name']} {self.user['last_name']} @id{self.user_id}"
+        )
+
+    @property
+    def is_available(self):
+        return not self.is_expired and self.limiter.paused_until <= time.monotonic()
+
+    def get_weight(self, key: int | str) -> int:
+        digest = hashlib.sha256(f"{key}:{self.user_id}".encode()).digest()
+        return int.from_bytes(digest[:8], "big")
+
+    def get_state(self) -> dict:
+        return {
+            "user_id": self.user_id,
+            "is_available": self.is_available,
+            "is_expired": self.is_expired,
+            **self.limiter.get_state(),
+        }
@@ -0,0 +1,35 @@
+import time
+
+
+class AlbumIndex:
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self.by_id: dict[int, dict] = {}
+        self.by_title: dict[str, dict] = {}
+        self.loaded_at: float | None = None
+
+    @property
+    def is_stale(self):
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > self.ttl
+
+    def load(self, albums: list[dict]):
+        self.by_id.clear()
+        self.by_title.clear()
+        for album in albums:
+            self.add(album)
+        self.loaded_at = time.monotonic()
+
+    def add(self, album: dict):
+        self.by_id[album["id"]] = album
+        self.by_title.setdefault(album["title"], album)
+
+    def remove(self, album_id: int):
+        album = self.by_id.pop(album_id, None)
+        if album is not None and self.by_title.get(album["title"]) is album:
+            self.by_title.pop(album["title"])
+
+    def get_by_id(self, album_id: int) -> dict | None:
+        return self.by_id.get(album_id)
+
+    def get_by_title(self, title: str) -> dict | None:
+        return self.by_title.get(title)
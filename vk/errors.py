@@ -15,6 +15,10 @@ class AccessDenied(MethodException):
 
 
 class OutOfTries(MethodException):
+    def __init__(self, method: VkApiMethod, retry_after: float | None = None):
+        super().__init__(method)
+        self.retry_after = retry_after
+
     def __str__(self):
         return f"Out of tries while processing {self.method}"
         
\ No newline at end of file
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import time
+from metrics import VK_THROTTLE_SECONDS
+
+TOO_MANY_RPS_CODE = 6
+FLOOD_CONTROL_CODE = 9
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        requests_per_second: float,
+        uploads_per_hour: int,
+        min_flood_backoff: int,
+        max_flood_backoff: int,
+    ):
+        self.max_rate = requests_per_second
+        self.rate = requests_per_second
+        self.tokens = requests_per_second
+        self.uploads_per_hour = uploads_per_hour
+        self.upload_tokens = float(uploads_per_hour)
+        self.updated = time.monotonic()
+        self.min_flood_backoff = min_flood_backoff
+        self.max_flood_backoff = max_flood_backoff
+        self.flood_backoff = min_flood_backoff
+        self.paused_until = 0.0
+        self.errors = {TOO_MANY_RPS_CODE: 0, FLOOD_CONTROL_CODE: 0}
+        self.lock = asyncio.Lock()
+        self.upload_lock = asyncio.Lock()
+
+    def __refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated
+        self.updated = now
+        self.tokens = min(max(1.0, self.rate), self.tokens + elapsed * self.rate)
+        self.upload_tokens = min(
+            self.uploads_per_hour,
+            self.upload_tokens + elapsed * self.uploads_per_hour / 3600,
+        )
+
+    async def __wait_pause(self):
+        delay = self.paused_until - time.monotonic()
+        if delay > 0:
+            logging.info(msg=f"VK requests are paused for {delay:.0f} seconds")
+            VK_THROTTLE_SECONDS.inc(delay, reason="pause")
+            await asyncio.sleep(delay)
+
+    async def acquire(self):
+        async with self.lock:
+            await self.__wait_pause()
+            self.__refill()
+            if self.tokens < 1:
+                delay = (1 - self.tokens) / self.rate
+                VK_THROTTLE_SECONDS.inc(delay, reason="rate")
+                await asyncio.sleep(delay)
+                self.__refill()
+            self.tokens -= 1
+
+    async def acquire_upload(self, amount: int = 1):
+        async with self.upload_lock:
+            self.__refill()
+            if self.upload_tokens < amount:
+                delay = (amount - self.upload_tokens) * 3600 / self.uploads_per_hour
+                logging.info(
+                    msg=f"Upload budget is exhausted. Waiting {delay:.0f} seconds..."
+                )
+                VK_THROTTLE_SECONDS.inc(delay, reason="uploads")
+                await asyncio.sleep(delay)
+                self.__refill()
+            self.upload_tokens -= amount
+
+    def on_success(self):
+        self.flood_backoff = self.min_flood_backoff
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + 0.1)
+
+    def on_error(self, code: int):
+        self.errors[code] = self.errors.get(code, 0) + 1
+        now = time.monotonic()
+        if code == TOO_MANY_RPS_CODE:
+            self.rate = max(0.5, self.rate / 2)
+            self.tokens = 0
+            self.paused_until = max(self.paused_until, now + 1 / self.rate)
+            logging.warning(
+                msg=f"Too many requests per second. Lowering rate to {self.rate:.2f}/s"
+            )
+        elif code == FLOOD_CONTROL_CODE:
+            self.paused_until = max(self.paused_until, now + self.flood_backoff)
+            logging.warning(
+                msg=f"Flood control. Pausing VK requests for {self.flood_backoff} seconds"
+            )
+            self.flood_backoff = min(self.max_flood_backoff, self.flood_backoff * 2)
+
+    def get_state(self) -> dict:
+        self.__refill()
+        return {
+            "rate": round(self.rate, 2),
+            "max_rate": self.max_rate,
+            "tokens": round(self.tokens, 2),
+            "upload_tokens": round(self.upload_tokens, 2),
+            "paused_for": max(0, round(self.paused_until - time.monotonic())),
+            "flood_backoff": self.flood_backoff,
+            "errors": dict(self.errors),
+        }